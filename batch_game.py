@@ -0,0 +1,239 @@
+#! python 3
+# batch_game.py - play thousands of 2048 games in lockstep.
+# Boards are kept as a (N,) np.uint64 array of bitboards (see
+# bitboard.py) and every move, score, tile spawn and game over check
+# is done for all games at once with NumPy vector operations.
+
+import numpy as np
+
+from bitboard import DIRECTIONS, ROW_LEFT, ROW_RIGHT, ROW_SCORE
+
+RIGHT, LEFT, UP, DOWN = range(4)
+_U64 = np.uint64
+_SHIFTS = np.arange(0, 64, 4, dtype=np.uint64)
+
+
+def transpose_boards(boards):
+    """Transpose every bitboard in a np.uint64 array."""
+    a1 = boards & _U64(0xF0F00F0FF0F00F0F)
+    a2 = boards & _U64(0x0000F0F00000F0F0)
+    a3 = boards & _U64(0x0F0F00000F0F0000)
+    a = a1 | (a2 << _U64(12)) | (a3 >> _U64(12))
+    b1 = a & _U64(0xFF00FF0000FF00FF)
+    b2 = a & _U64(0x00FF00FF00000000)
+    b3 = a & _U64(0x00000000FF00FF00)
+    return b1 | (b2 >> _U64(24)) | (b3 << _U64(24))
+
+
+def _move_rows(boards, table):
+    result = np.zeros_like(boards)
+    score = np.zeros(boards.shape, dtype=np.int64)
+    for shift in (_U64(0), _U64(16), _U64(32), _U64(48)):
+        rows = ((boards >> shift) & _U64(0xFFFF)).astype(np.intp)
+        result |= table[rows].astype(np.uint64) << shift
+        score += ROW_SCORE[rows]
+    return result, score
+
+
+def move_boards(boards, direction):
+    """Move all bitboards in direction (code or name).
+
+    :returns: tuple. np.uint64 array of boards, np.array of scores.
+    """
+    if isinstance(direction, str):
+        direction = DIRECTIONS.index(direction)
+    if direction == RIGHT:
+        return _move_rows(boards, ROW_RIGHT)
+    if direction == LEFT:
+        return _move_rows(boards, ROW_LEFT)
+    moved, score = _move_rows(transpose_boards(boards),
+                              ROW_LEFT if direction == UP else ROW_RIGHT)
+    return transpose_boards(moved), score
+
+
+def board_exponents(boards):
+    """Returns (N, 16) array of log2 tile values, row by row."""
+    return ((boards[:, None] >> _SHIFTS) & _U64(0xF)).astype(np.int64)
+
+
+def boards_to_grids(boards):
+    """Returns (N, 4, 4) array of tile values."""
+    exponents = board_exponents(boards)
+    return np.where(exponents > 0, 1 << exponents, 0).reshape(-1, 4, 4)
+
+
+def grids_to_boards(grids):
+    """Gets (N, 4, 4) array of tile values, returns np.uint64 bitboards."""
+    grids = np.asarray(grids).reshape(-1, 16)
+    exponents = np.zeros(grids.shape, dtype=np.uint64)
+    nonzero = grids > 0
+    exponents[nonzero] = np.log2(grids[nonzero]).astype(np.uint64)
+    return np.bitwise_or.reduce(exponents << _SHIFTS, axis=1)
+
+
+class BatchGame:
+    """N independent games of 2048 advanced together.
+
+    n_games: int.
+    seed: int or np.random.Generator. Seed of the tile spawning RNG.
+    win_tile: int. A game that reaches this tile stops (like is_win).
+    """
+
+    def __init__(self, n_games, seed=None, win_tile=2048):
+        self.n_games = n_games
+        self.rng = np.random.default_rng(seed)
+        self.win_exponent = int(win_tile).bit_length() - 1
+        self.restart()
+
+    def restart(self):
+        """Start all games over with 2 random tiles each."""
+        self.boards = np.zeros(self.n_games, dtype=np.uint64)
+        self.scores = np.zeros(self.n_games, dtype=np.int64)
+        self.moves_count = np.zeros(self.n_games, dtype=np.int64)
+        self.active = np.ones(self.n_games, dtype=bool)
+        self.steps = 0
+        everyone = np.ones(self.n_games, dtype=bool)
+        self.add_random_tiles(everyone)
+        self.add_random_tiles(everyone)
+
+    def add_random_tiles(self, mask):
+        """Put a 2 or 4 on a random empty cell of boards in mask."""
+        empty = board_exponents(self.boards) == 0
+        keys = self.rng.random(empty.shape)
+        keys[~empty] = -1
+        cells = np.argmax(keys, axis=1).astype(np.uint64)
+        mask = mask & empty.any(axis=1)
+        values = np.where(self.rng.random(self.n_games) < 0.9, 1, 2)
+        tiles = values.astype(np.uint64) << (_U64(4) * cells)
+        self.boards[mask] |= tiles[mask]
+
+    def possible_moves(self):
+        """Moves all boards in each of the 4 directions.
+
+        :returns: tuple of (4, N) arrays: boards, scores and whether
+        the board changed.
+        """
+        moved = np.empty((4, self.n_games), dtype=np.uint64)
+        scores = np.empty((4, self.n_games), dtype=np.int64)
+        for direction in range(4):
+            moved[direction], scores[direction] = move_boards(self.boards,
+                                                              direction)
+        return moved, scores, moved != self.boards
+
+    def step(self, preferences):
+        """Make one move in every active game.
+
+        Each game makes the first move of its preferences row that
+        changes its board. Games that can't move or reached win_tile
+        become inactive.
+
+        :param preferences: int array (N, k) or (k,) of direction codes.
+        :returns: np.array of bool, True where a move was made.
+        """
+        preferences = np.broadcast_to(np.asarray(preferences),
+                                      (self.n_games, np.shape(preferences)[-1]))
+        moved, scores, changed = self.possible_moves()
+        self.active &= changed.any(axis=0)
+        games = np.arange(self.n_games)
+        can_move = changed[preferences.T, games]
+        first = np.argmax(can_move, axis=0)
+        do_move = can_move.any(axis=0) & self.active
+        chosen = preferences[games, first]
+        self.boards = np.where(do_move, moved[chosen, games], self.boards)
+        self.scores += np.where(do_move, scores[chosen, games], 0)
+        self.moves_count += do_move
+        self.add_random_tiles(do_move)
+        self.active &= ~self.is_win()
+        self.steps += 1
+        return do_move
+
+    def is_game_over(self):
+        """Returns np.array of bool, True where no move changes board."""
+        return ~self.possible_moves()[2].any(axis=0)
+
+    def is_win(self):
+        """Returns np.array of bool, True where reached win_tile."""
+        return board_exponents(self.boards).max(axis=1) >= self.win_exponent
+
+    def highest_tiles(self):
+        """Returns np.array of highest tile value of each game."""
+        return 1 << board_exponents(self.boards).max(axis=1)
+
+    def results(self):
+        """Returns (N, 3) array: (Score, Highest tile, Number of moves)."""
+        return np.column_stack((self.scores, self.highest_tiles(),
+                                self.moves_count))
+
+
+# Batched versions of the Session strategies. Each gets the BatchGame
+# and returns the move preferences of the current step.
+def total_random_preferences(game):
+    """Every move is randomly picked."""
+    return game.rng.permuted(np.tile(np.arange(4), (game.n_games, 1)),
+                             axis=1)
+
+
+def fixed_path_preferences(game):
+    """Repeatedly move based on a fixed path: right, up, left, down."""
+    path = (RIGHT, UP, LEFT, DOWN)
+    return [path[game.steps % 4]]
+
+
+def no_left_random_preferences(game):
+    """Random move out of {right, up, down}, left as a last resort."""
+    others = game.rng.permuted(np.tile([RIGHT, UP, DOWN], (game.n_games, 1)),
+                               axis=1)
+    return np.column_stack((others, np.full(game.n_games, LEFT)))
+
+
+def right_trend_no_left_preferences(game):
+    """Right if possible, else random of up/down, left as last resort."""
+    up_down = game.rng.permuted(np.tile([UP, DOWN], (game.n_games, 1)),
+                                axis=1)
+    return np.column_stack((np.full(game.n_games, RIGHT), up_down,
+                            np.full(game.n_games, LEFT)))
+
+
+def right_and_down_trend_preferences(game):
+    """Priority: right, down, up, left."""
+    return [RIGHT, DOWN, UP, LEFT]
+
+
+def r_a_d_t_with_block_flag_preferences(game):
+    """Priority: right, down, up, left. Up before down if blocked."""
+    exponents = board_exponents(game.boards).reshape(-1, 4, 4)
+    tiles = exponents[:, 1:, 1:]
+    blocked = ((tiles != 0) & ((tiles < exponents[:, :-1, 1:]) |
+                               (tiles < exponents[:, 1:, :-1])))
+    flag = blocked.any(axis=(1, 2))
+    return np.where(flag[:, None], [RIGHT, UP, DOWN, LEFT],
+                    [RIGHT, DOWN, UP, LEFT])
+
+
+BATCH_STRATEGIES = {'tr': total_random_preferences,
+                    'fp': fixed_path_preferences,
+                    'nlr': no_left_random_preferences,
+                    'rtnl': right_trend_no_left_preferences,
+                    'radt': right_and_down_trend_preferences,
+                    'radtbf': r_a_d_t_with_block_flag_preferences}
+
+
+def play_batch(strategy, n_games, seed=None, win_tile=2048):
+    """Play n_games of strategy till all are over.
+
+    :param strategy: str key of BATCH_STRATEGIES, or function that gets
+    a BatchGame and returns move preferences.
+    :return: (N, 3) array: (Score, Highest tile, Number of moves)
+    """
+    if isinstance(strategy, str):
+        strategy = BATCH_STRATEGIES[strategy]
+    game = BatchGame(n_games, seed=seed, win_tile=win_tile)
+    while game.active.any():
+        game.step(strategy(game))
+    return game.results()
+
+
+if __name__ == '__main__':
+    for name in BATCH_STRATEGIES:
+        results = play_batch(name, 10000, seed=0)
+        print(name, results.mean(axis=0))
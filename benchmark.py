@@ -0,0 +1,139 @@
+#! python 3
+# benchmark.py - measure speed and quality of play of the strategies
+# in simulateGame and of the genetic algorithm's play_game.
+# Every strategy plays the same fixed seeds on a local game, results
+# are written to a JSON file to compare between versions.
+
+import json
+import platform
+import sys
+import time
+import datetime
+
+import numpy as np
+import pandas as pd
+
+import simulateGame
+import evolving_algorithm
+
+SEEDS = range(10)
+RESULTS_PATH = 'benchmark_results.json'
+# genome played by the 'ga' entry
+GA_GENOME = pd.Series({'w_highest tile': 0.5,
+                       'w_score': 0.2,
+                       'w_number of zeros': 0.4,
+                       'w_potential two step score': 0.3,
+                       'w_distance from right': -0.1,
+                       'w_distance from corner': -0.2})
+
+
+class TimedSession(simulateGame.LocalSession):
+    """LocalSession that times the decision before every move.
+
+    Decision latency is the time from the end of the previous move that
+    changed the board (or the start of the game) till the strategy asks
+    for the next one that changes it. Moves that don't change the board
+    are part of the decision, not latencies of their own.
+
+    moves_count: int. Moves of the current game that changed the board.
+    """
+
+    def __init__(self, seed=None):
+        self.latencies = []
+        self.moves_count = 0
+        self._last_move_end = None
+        super().__init__(seed=seed)
+
+    def restart_game(self):
+        super().restart_game()
+        self.moves_count = 0
+        self._last_move_end = time.perf_counter()
+
+    def _move(self, direction):
+        start = time.perf_counter()
+        super()._move(direction)
+        if self.moved:
+            self.latencies.append(start - self._last_move_end)
+            self.moves_count += 1
+            self._last_move_end = time.perf_counter()
+
+
+def play_ga_game(session, rng=None):
+    """Play a game of play_game with GA_GENOME.
+
+    :param session: TimedSession.
+    :param rng: unused, play_game is deterministic.
+    :return: (Score, Highest tile, Number of moves)
+    """
+    max_tile, final_score = evolving_algorithm.play_game(session, GA_GENOME)
+    return final_score, max_tile, session.moves_count
+
+
+def benchmark_strategy(strategy, seeds=SEEDS):
+    """Play a game for every seed and measure it.
+
+    :param strategy: function that gets a session and returns
+    (Score, Highest tile, Number of moves).
+    :return: dict of metrics.
+    """
+    scores, max_tiles, moves, latencies = [], [], [], []
+    start = time.perf_counter()
+    for seed in seeds:
+        # separate streams for tile spawns and for the strategy's moves
+        spawn_seed, moves_seed = np.random.SeedSequence(seed).spawn(2)
+        session = TimedSession(seed=spawn_seed)
+        score, max_tile, moves_count = strategy(
+            session, rng=np.random.default_rng(moves_seed))
+        scores.append(int(score))
+        max_tiles.append(int(max_tile))
+        moves.append(int(moves_count))
+        latencies.extend(session.latencies)
+    duration = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    tiles, counts = np.unique(max_tiles, return_counts=True)
+    return {'games': len(scores),
+            'seconds': duration,
+            'games_per_sec': len(scores) / duration,
+            'moves_per_sec': len(latencies) / duration,
+            'latency_ms_p50': float(np.percentile(latencies, 50)),
+            'latency_ms_p99': float(np.percentile(latencies, 99)),
+            'score_mean': float(np.mean(scores)),
+            'score_std': float(np.std(scores)),
+            'score_percentiles': {str(q): float(np.percentile(scores, q))
+                                  for q in (10, 50, 90)},
+            'max_tile_counts': {str(t): int(c)
+                                for t, c in zip(tiles, counts)},
+            'moves_mean': float(np.mean(moves))}
+
+
+def run_benchmark(strategies=None, seeds=SEEDS):
+    """Benchmark strategies (names in simulateGame.STRATEGIES or 'ga').
+
+    :return: dict of metadata and metrics of every strategy.
+    """
+    all_strategies = dict(simulateGame.STRATEGIES, ga=play_ga_game)
+    names = strategies or list(all_strategies)
+    results = {'date': datetime.datetime.now().isoformat(),
+               'python': sys.version.split()[0],
+               'numpy': np.__version__,
+               'machine': platform.machine(),
+               'seeds': list(seeds),
+               'strategies': dict()}
+    for name in names:
+        results['strategies'][name] = benchmark_strategy(all_strategies[name],
+                                                         seeds)
+        metrics = results['strategies'][name]
+        print(f"{name}: {metrics['moves_per_sec']:.0f} moves/sec, "
+              f"p99 {metrics['latency_ms_p99']:.2f} ms, "
+              f"score {metrics['score_mean']:.0f}")
+    return results
+
+
+def write_results(results, path=RESULTS_PATH):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    write_results(run_benchmark(sys.argv[1:] or None))
@@ -0,0 +1,239 @@
+#! python 3
+# bitboard.py - compact 64-bit representation of a 2048 board.
+# Each of the 16 cells is a nibble holding log2 of the tile value
+# (0 for an empty cell). Cell (row, col) is stored in nibble
+# 4 * row + col, so row r is the 16 bits starting at bit 16 * r and
+# column 0 is the lowest nibble of a row.
+
+import numpy as np
+
+DIRECTIONS = ('right', 'left', 'up', 'down')
+ROW_MASK = 0xFFFF
+COL_MASK = 0x000F000F000F000F
+
+
+def _move_row_left(row):
+    """Returns row (list of 4 exponents) moved left and score of merges."""
+    tiles = [x for x in row if x != 0]
+    result = []
+    score = 0
+    i = 0
+    while i < len(tiles):
+        # 15 is the largest exponent a nibble can hold, don't merge it.
+        if (i + 1 < len(tiles) and tiles[i] == tiles[i + 1]
+                and tiles[i] != 15):
+            result.append(tiles[i] + 1)
+            score += 2 ** (tiles[i] + 1)
+            i += 2
+        else:
+            result.append(tiles[i])
+            i += 1
+    return result + [0] * (4 - len(result)), score
+
+
+def _reverse_row(row):
+    """Mirror the 4 nibbles of a 16 bit row."""
+    return (((row & 0xF) << 12) | ((row & 0xF0) << 4) |
+            ((row >> 4) & 0xF0) | (row >> 12))
+
+
+def _build_tables():
+    """Build lookup tables for all 65536 possible rows."""
+    row_left = np.zeros(65536, dtype=np.uint16)
+    row_right = np.zeros(65536, dtype=np.uint16)
+    row_score = np.zeros(65536, dtype=np.uint32)
+    for row in range(65536):
+        cells = [(row >> (4 * c)) & 0xF for c in range(4)]
+        moved, score = _move_row_left(cells)
+        row_left[row] = (moved[0] | (moved[1] << 4) |
+                         (moved[2] << 8) | (moved[3] << 12))
+        row_score[row] = score
+    for row in range(65536):
+        rev = _reverse_row(row)
+        row_right[row] = _reverse_row(int(row_left[rev]))
+    return row_left, row_right, row_score
+
+
+# ROW_LEFT[row] / ROW_RIGHT[row]: row after moving left / right.
+# ROW_SCORE[row]: score earned by that move (same for both directions).
+ROW_LEFT, ROW_RIGHT, ROW_SCORE = _build_tables()
+# plain lists are faster than np.arrays for single lookups.
+_row_left = ROW_LEFT.tolist()
+_row_right = ROW_RIGHT.tolist()
+_row_score = ROW_SCORE.tolist()
+_row_reverse = [_reverse_row(row) for row in range(65536)]
+
+
+def from_grid(grid):
+    """Gets np.array 4x4 of tile values, returns bitboard (int)."""
+    board = 0
+    for i, value in enumerate(np.asarray(grid).flatten().tolist()):
+        if value:
+            board |= (int(value).bit_length() - 1) << (4 * i)
+    return board
+
+
+def to_grid(board):
+    """Gets bitboard, returns np.array 4x4 of tile values."""
+    exponents = [(board >> (4 * i)) & 0xF for i in range(16)]
+    grid = np.array([1 << e if e else 0 for e in exponents])
+    return grid.reshape(4, 4)
+
+
+def transpose(board):
+    """Returns the bitboard transposed (rows become columns)."""
+    a1 = board & 0xF0F00F0FF0F00F0F
+    a2 = board & 0x0000F0F00000F0F0
+    a3 = board & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+def _move_rows(board, table):
+    """Apply row table on each row, returns (board, score)."""
+    result = 0
+    score = 0
+    for shift in (0, 16, 32, 48):
+        row = (board >> shift) & ROW_MASK
+        result |= table[row] << shift
+        score += _row_score[row]
+    return result, score
+
+
+def move(board, direction):
+    """Return bitboard if moved in direction (without added tile).
+
+    :returns: tuple. bitboard (int) and score that earned by move.
+    """
+    if direction == 'right':
+        return _move_rows(board, _row_right)
+    if direction == 'left':
+        return _move_rows(board, _row_left)
+    if direction == 'up':
+        moved, score = _move_rows(transpose(board), _row_left)
+        return transpose(moved), score
+    if direction == 'down':
+        moved, score = _move_rows(transpose(board), _row_right)
+        return transpose(moved), score
+    raise ValueError(f'unknown direction: {direction}')
+
+
+# The 8 symmetries of the board (rotations and reflections) are numbered
+# 0-7: symmetry s transposes if s & 4, then mirrors the columns if
+# s & 1, then flips the rows if s & 2. 0 is the identity.
+SYMMETRIES = range(8)
+# direction on the board -> direction on its transposed / mirrored /
+# flipped board
+_TRANSPOSED = {'right': 'down', 'left': 'up', 'up': 'left', 'down': 'right'}
+_MIRRORED = {'right': 'left', 'left': 'right', 'up': 'up', 'down': 'down'}
+_FLIPPED = {'right': 'right', 'left': 'left', 'up': 'down', 'down': 'up'}
+
+
+def mirror(board):
+    """Returns the bitboard with the order of columns reversed."""
+    return (_row_reverse[board & ROW_MASK] |
+            (_row_reverse[(board >> 16) & ROW_MASK] << 16) |
+            (_row_reverse[(board >> 32) & ROW_MASK] << 32) |
+            (_row_reverse[board >> 48] << 48))
+
+
+def flip(board):
+    """Returns the bitboard with the order of rows reversed."""
+    return (((board & ROW_MASK) << 48) | (((board >> 16) & ROW_MASK) << 32) |
+            (((board >> 32) & ROW_MASK) << 16) | (board >> 48))
+
+
+def apply_symmetry(board, symmetry):
+    """Returns the bitboard transformed by symmetry (0-7)."""
+    if symmetry & 4:
+        board = transpose(board)
+    if symmetry & 1:
+        board = mirror(board)
+    if symmetry & 2:
+        board = flip(board)
+    return board
+
+
+def invert_symmetry(board, symmetry):
+    """Returns the board that apply_symmetry transformed into board."""
+    if symmetry & 2:
+        board = flip(board)
+    if symmetry & 1:
+        board = mirror(board)
+    if symmetry & 4:
+        board = transpose(board)
+    return board
+
+
+def canonical(board):
+    """Returns (smallest of the 8 symmetric boards, its symmetry).
+
+    Symmetric boards have the same canonical board, so it can key
+    caches of anything that doesn't change under rotation and
+    reflection (moves get mapped with direction_to_canonical).
+    """
+    mirrored = mirror(board)
+    transposed = transpose(board)
+    transposed_mirrored = mirror(transposed)
+    return min((board, 0), (mirrored, 1), (flip(board), 2),
+               (flip(mirrored), 3), (transposed, 4),
+               (transposed_mirrored, 5), (flip(transposed), 6),
+               (flip(transposed_mirrored), 7))
+
+
+def direction_to_canonical(direction, symmetry):
+    """Returns the direction on apply_symmetry(board, symmetry) that
+    makes the same move as direction on board."""
+    if symmetry & 4:
+        direction = _TRANSPOSED[direction]
+    if symmetry & 1:
+        direction = _MIRRORED[direction]
+    if symmetry & 2:
+        direction = _FLIPPED[direction]
+    return direction
+
+
+def direction_from_canonical(direction, symmetry):
+    """Inverse of direction_to_canonical."""
+    if symmetry & 2:
+        direction = _FLIPPED[direction]
+    if symmetry & 1:
+        direction = _MIRRORED[direction]
+    if symmetry & 4:
+        direction = _TRANSPOSED[direction]
+    return direction
+
+
+def apply_symmetry_grid(grid, symmetry):
+    """apply_symmetry of a np.array grid, returns a view."""
+    if symmetry & 4:
+        grid = grid.T
+    if symmetry & 1:
+        grid = grid[:, ::-1]
+    if symmetry & 2:
+        grid = grid[::-1]
+    return grid
+
+
+def invert_symmetry_grid(grid, symmetry):
+    """invert_symmetry of a np.array grid, returns a view."""
+    if symmetry & 2:
+        grid = grid[::-1]
+    if symmetry & 1:
+        grid = grid[:, ::-1]
+    if symmetry & 4:
+        grid = grid.T
+    return grid
+
+
+def count_empty(board):
+    """Returns number of empty cells on bitboard."""
+    return sum(1 for i in range(16) if not (board >> (4 * i)) & 0xF)
+
+
+def max_exponent(board):
+    """Returns log2 of highest tile on bitboard."""
+    return max((board >> (4 * i)) & 0xF for i in range(16))
@@ -3,30 +3,123 @@
 # from simulateGame.
 
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
 import datetime
 
 import simulateGame
+from results_sink import ResultsSink, REL_WIDTH
 
-start_time = datetime.datetime.now()
-ns = simulateGame.Session()
-strategies = [('tr', ns.total_random_game),
-              ('fp', ns.fixed_path_game),
-              ('nlr', ns.no_left_random_game),
-              ('rtnl', ns.right_trend_no_left_game),
-              ('radt', ns.right_and_down_trend_game)]
-              # ('greedy_random', simulateGame.greedy_random_game)]
-with open('2_step_score_greedy_no_left.txt', 'w') as file:
-    for i in range(30):
-        # strategy_type, strategy = strategies[np.random.randint(5)]
-        # score, highest_tile, moves_count = strategy()
-        score, highest_tile, moves_count = simulateGame.two_step_score_greedy_no_left_game(ns)
-        # file.write(f'{strategy_type},{score},{highest_tile},{moves_count}\n')
-        file.write(f'2ssgnl,{score},{highest_tile},{moves_count}\n')
+# games played by a worker process in one task
+CHUNK_SIZE = 10
+
+
+def play_games(strategy_type, n_games, seed=None):
+    """Play games of a strategy on a simulateGame.LocalSession.
+
+    :param strategy_type: str. key of simulateGame.STRATEGIES.
+    :param n_games: int.
+    :param seed: int or np.random.SeedSequence.
+    :return: list of (strategy_type, score, highest_tile, moves_count).
+    """
+    seed_seq = (seed if isinstance(seed, np.random.SeedSequence)
+                else np.random.SeedSequence(seed))
+    strategy = simulateGame.STRATEGIES[strategy_type]
+    # separate streams for tile spawns and for the strategy's moves
+    spawn_seed, moves_seed = seed_seq.spawn(2)
+    ns = simulateGame.LocalSession(seed=spawn_seed)
+    rng = np.random.default_rng(moves_seed)
+    results = []
+    for _ in range(n_games):
+        score, highest_tile, moves_count = strategy(ns, rng=rng)
+        results.append((strategy_type, int(score), int(highest_tile),
+                        int(moves_count)))
         ns.restart_game()
-        print(f'game {i+1}')
-end_time = datetime.datetime.now()
-print(f'Time duration {end_time - start_time}')
-ns.end_session()
+    return results
+
+
+def _chunks(n_games):
+    """Returns list of number of games in every chunk of n_games."""
+    chunks = [CHUNK_SIZE] * (n_games // CHUNK_SIZE)
+    if n_games % CHUNK_SIZE:
+        chunks.append(n_games % CHUNK_SIZE)
+    return chunks
+
+
+def run_parallel(strategy_type, n_games, workers=None, seed=None):
+    """Play n_games of a strategy across a pool of worker processes.
+
+    Games are split into chunks of CHUNK_SIZE, each with its own seed
+    spawned from seed, so results don't depend on number of workers.
+
+    :param workers: int. Number of processes, default os.cpu_count().
+    :return: list of (strategy_type, score, highest_tile, moves_count).
+    """
+    chunks = _chunks(n_games)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for chunk in pool.map(play_games, [strategy_type] * len(chunks),
+                              chunks, seeds):
+            results.extend(chunk)
+    return results
+
+
+def run_until_confident(strategy_type, sink, max_games, rel_width=REL_WIDTH,
+                        workers=None, seed=None):
+    """Play games of a strategy into sink until the confidence interval
+    of its mean score is narrower than rel_width of the mean.
+
+    Chunks are played a round of workers chunks at a time, the check is
+    done after every round, so at most max_games games are played.
+    Games already in sink count towards the interval.
+
+    :param sink: results_sink.ResultsSink.
+    :return: results_sink.RunningStats of the strategy.
+    """
+    workers = workers or os.cpu_count()
+    chunks = _chunks(max_games)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(chunks), workers):
+            if sink.should_stop(strategy_type, rel_width):
+                break
+            round_chunks = chunks[start:start + workers]
+            for chunk in pool.map(play_games,
+                                  [strategy_type] * len(round_chunks),
+                                  round_chunks,
+                                  seeds[start:start + workers]):
+                sink.extend(chunk)
+    return sink.stats[strategy_type]
+
+
+def write_results(results, path, mode='w'):
+    """Write (strategy, score, highest_tile, moves_count) rows to file."""
+    with open(path, mode) as file:
+        for strategy_type, score, highest_tile, moves_count in results:
+            file.write(f'{strategy_type},{score},{highest_tile},'
+                       f'{moves_count}\n')
+
+
+def collect_from_browser(strategy_type, n_games, path):
+    """Play games one after another on the web game, appending results
+    to path as they finish."""
+    ns = simulateGame.Session()
+    strategy = simulateGame.STRATEGIES[strategy_type]
+    with ResultsSink(path) as sink:
+        for i in range(n_games):
+            score, highest_tile, moves_count = strategy(ns)
+            sink.extend([(strategy_type, score, highest_tile, moves_count)])
+            ns.restart_game()
+            print(f'game {i+1}')
+    ns.end_session()
+
+
+if __name__ == '__main__':
+    start_time = datetime.datetime.now()
+    write_results(run_parallel('2ssgnl', 30),
+                  '2_step_score_greedy_no_left.txt')
+    end_time = datetime.datetime.now()
+    print(f'Time duration {end_time - start_time}')
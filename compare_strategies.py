@@ -0,0 +1,140 @@
+#! python 3
+# compare_strategies.py - rank strategies (or GA genomes) by mean score
+# with successive halving: every round all remaining candidates play
+# the same number of games, and the worse half is dropped, so most of
+# the games go to the close contenders instead of clearly inferior ones.
+# Usage:
+#     ranking = compare_strategies(budget=2000, seed=1)
+#     ranking = compare_genomes(population, budget=200, seed=1)
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from collectData import play_games, _chunks
+from evolving_algorithm import evaluate_genome
+from results_sink import RunningStats
+
+# fraction of candidates kept every round is 1 / ETA
+ETA = 2
+BUDGET = 1000
+# strategies of simulateGame.STRATEGIES fast enough to compare
+STRATEGY_NAMES = ['tr', 'fp', 'nlr', 'rtnl', 'radt', 'radtbf',
+                  'greedy_random', 'sgr', 'grtnl', '2ssgr', '2ssgnl']
+
+
+def successive_halving(play_round, arms, budget=BUDGET, eta=ETA, seed=None):
+    """Split budget games between arms by successive halving.
+
+    The budget is split evenly between ceil(log_eta(len(arms))) rounds,
+    and a round's games evenly between the arms still in it.
+
+    :param play_round: function (arms, n_games, seed) that returns dict
+    of arm: list of (score, highest_tile, moves_count). All arms of a
+    round get the same seed.
+    :param arms: list of hashable candidates.
+    :param budget: int. Total number of games.
+    :param eta: int. Only the best 1 / eta of the arms go on every round.
+    :return: pd.DataFrame of RunningStats.summary() and the round an arm
+    was dropped in, best arm first.
+    """
+    stats = {arm: RunningStats() for arm in arms}
+    dropped_in = dict()
+    rounds = max(1, math.ceil(math.log(len(arms), eta)))
+    alive = list(arms)
+    for round_number, round_seed in enumerate(
+            np.random.SeedSequence(seed).spawn(rounds), 1):
+        n_games = max(1, budget // (rounds * len(alive)))
+        for arm, results in play_round(alive, n_games, round_seed).items():
+            for score, highest_tile, moves_count in results:
+                stats[arm].add(score, highest_tile, moves_count)
+        alive.sort(key=lambda arm: stats[arm].mean, reverse=True)
+        keep = math.ceil(len(alive) / eta)
+        for arm in alive[keep:]:
+            dropped_in[arm] = round_number
+        alive = alive[:keep]
+
+    ranking = alive + sorted(dropped_in, key=lambda arm: (-dropped_in[arm],
+                                                          -stats[arm].mean))
+    summary = pd.DataFrame.from_dict(
+        {arm: stats[arm].summary() for arm in ranking}, orient='index')
+    summary['dropped in round'] = [dropped_in.get(arm) for arm in ranking]
+    return summary
+
+
+def play_strategies_round(strategies, n_games, seed, workers=None,
+                          sink=None):
+    """Play n_games of every strategy across worker processes.
+
+    :param sink: results_sink.ResultsSink to append the games to, or None.
+    :return: dict of strategy: list of (score, highest_tile, moves_count).
+    """
+    chunks = _chunks(n_games)
+    seeds = seed.spawn(len(chunks))
+    results = {strategy_type: [] for strategy_type in strategies}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        all_chunks = pool.map(play_games,
+                              [strategy_type for strategy_type in strategies
+                               for _ in chunks],
+                              chunks * len(strategies),
+                              seeds * len(strategies))
+        for chunk in all_chunks:
+            if sink is not None:
+                sink.extend(chunk)
+            for strategy_type, *result in chunk:
+                results[strategy_type].append(result)
+    return results
+
+
+def play_genomes_round(population, genomes, n_games, seed, workers=None):
+    """Play n_games with every genome (index in population) across worker
+    processes.
+
+    play_game doesn't count moves, so moves_count is 0.
+    :return: dict of genome index: list of (score, highest_tile, 0).
+    """
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        all_results = pool.map(evaluate_genome, population[genomes],
+                               [n_games] * len(genomes),
+                               [seed] * len(genomes))
+        return {genome: [(score, max_tile, 0) for max_tile, score in results]
+                for genome, results in zip(genomes, all_results)}
+
+
+def compare_strategies(strategies=None, budget=BUDGET, eta=ETA, workers=None,
+                       seed=None, sink=None):
+    """Rank strategies of simulateGame.STRATEGIES by mean score.
+
+    :param strategies: list of names, default STRATEGY_NAMES.
+    :param sink: results_sink.ResultsSink to append all games to.
+    :return: pd.DataFrame, best strategy first.
+    """
+    def play_round(arms, n_games, round_seed):
+        return play_strategies_round(arms, n_games, round_seed, workers, sink)
+
+    return successive_halving(play_round, strategies or STRATEGY_NAMES,
+                              budget, eta, seed)
+
+
+def compare_genomes(population, budget=BUDGET, eta=ETA, workers=None,
+                    seed=None):
+    """Rank GA genomes by mean score of play_game.
+
+    :param population: np.array (pop, len(WEIGHTS)).
+    :return: pd.DataFrame indexed by genome index, best genome first.
+    """
+    population = np.asarray(population, dtype=float)
+
+    def play_round(arms, n_games, round_seed):
+        return play_genomes_round(population, arms, n_games, round_seed,
+                                  workers)
+
+    return successive_halving(play_round, list(range(len(population))),
+                              budget, eta, seed)
+
+
+if __name__ == '__main__':
+    print(compare_strategies())
@@ -7,15 +7,20 @@
 
 import time
 import math
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
 from selenium.common.exceptions import StaleElementReferenceException
 
-from simulateGame import (Session, Board, get_potential_moves_score,
+from simulateGame import (Session, LocalSession, get_potential_moves_score,
                           get_number_of_zeros, get_max_tile,
                           get_distance_from_lower_right_corner,
-                          get_distance_from_right_wall)
+                          get_distance_from_right_wall, get_if_moved_grids)
+from batch_game import grids_to_boards, move_boards
+import selection
 
 # to show all columns of DataFrame
 # when printing in pycharm console
@@ -31,41 +36,67 @@ MUTATION_RATE = 0.05
 MUTATION_CHANGE = 0.2
 EDGES_SIZE = 1
 MAX_GENERATION = 1
+GAMES_PER_GENOME = 5
+# parent selection method, a key of selection.METHODS
+SELECTION = 'roulette'
+# main_process saves a checkpoint every CHECKPOINT_EVERY generations
+CHECKPOINT_EVERY = 1
+# fitness statistics of games played by each genome, in addition to
+# the mean which is kept in 'max tile' and 'final score'.
+STATS_COLS = ['max tile median', 'max tile max',
+              'final score median', 'final score max']
+FITNESS_COLS = ['max tile', 'final score'] + STATS_COLS
+
+# Genomes attribution:
+# Weights for use of Evolving Algorithms to evaluate moves.
+# Also the order of features columns returned by extract_features.
+WEIGHTS = ['w_highest tile',
+           'w_score',
+           'w_number of zeros',
+           'w_potential two step score',
+           'w_distance from right',
+           'w_distance from corner']
+
+
+def initialize_population(rng=None):
+    """Returns np.array (POPULATION_SIZE, len(WEIGHTS)) of random weights.
+
+    :param rng: np.random.Generator or seed.
+    """
+    rng = np.random.default_rng(rng)
+    return rng.random((POPULATION_SIZE, len(WEIGHTS))) - WEIGHT_CONST
+
+
+def initialize_genomes_df(rng=None):
+    """Returns a DataFrame with first generation genomes
+
+    :param rng: np.random.Generator or seed.
+    """
+    return generation_to_df(initialize_population(rng), 1)
+
 
-# # Genomes attribution:
-# # Weights for use of Evolving Algorithms to evaluate moves.
-# weights = ['w_highest tile',
-#            'w_score',
-#            'w_number of zeros',
-#            'w_potential two step score',
-#            'w_distance from right',
-#            'w_distance from corner']
-# # additional attribute for easier management.
-# cols = weights + ['generation', 'max tile', 'final score']
-
-
-def initialize_genomes_df():
-    """Returns a DataFrame with first generation genomes"""
-    # Genomes attribution:
-    # Weights for use of Evolving Algorithms to evaluate moves.
-    weights = ['w_highest tile',
-               'w_score',
-               'w_number of zeros',
-               'w_potential two step score',
-               'w_distance from right',
-               'w_distance from corner']
-    # additional attribute for easier management.
-    cols = weights + ['generation', 'max tile', 'final score']
-    # Store genomes in a pd.DataFrame
-    genomes = pd.DataFrame(columns=cols)
-    # Initialize genome population with random weights
-    generation = 1
-    for _ in range(POPULATION_SIZE):
-        rand_weights = list(np.random.rand(len(weights)) - WEIGHT_CONST)
-        genomes.loc[len(genomes)] = rand_weights + [generation, None, None]
+def generation_to_df(population, generation, fitness=None):
+    """Returns a genomes table (pd.DataFrame) of one generation.
+
+    :param population: np.array (pop, len(WEIGHTS)).
+    :param generation: int.
+    :param fitness: np.array (pop, len(FITNESS_COLS)), None if the
+    generation wasn't evaluated yet.
+    """
+    genomes = pd.DataFrame(population, columns=WEIGHTS)
+    genomes['generation'] = generation
+    if fitness is None:
+        fitness = np.full((len(population), len(FITNESS_COLS)), np.nan)
+    genomes[FITNESS_COLS] = fitness
     return genomes
 
 
+def population_from_df(genomes_df, generation):
+    """Returns np.array of weights of genomes of generation."""
+    genomes = genomes_df[genomes_df['generation'] == generation]
+    return genomes[WEIGHTS].to_numpy(dtype=float)
+
+
 def evaluate_move(poss_move):
     """Gets a Board obj and evaluate params.
 
@@ -94,71 +125,112 @@ def evaluate_move(poss_move):
     return evaluated_params
 
 
-def breed(genome_a, genome_b):
-    """Return a third genome created out of 2 given genomes.
-
-    :param genome_a: pd.Series.
-    :param genome_b: pd.Series.
-    :return pd.Series.
-    """
-    # Method: for each 'weight' field (w_) randomly choose that field
-    # between the 2 given genomes.
-    # Randomly mutate.
-    child_genome = pd.Series()
-    for i in genome_a.columns:
-        if 'w_' in i:
-            options = [genome_a.iloc[0][i], genome_b.iloc[0][i]]
-            child_genome[i] = options[np.random.randint(2)]
-            # Mutation step
-            if np.random.random() < MUTATION_RATE:
-                child_genome[i] += MUTATION_CHANGE * (
-                        2 * np.random.random() - 1)
-        else:
-            child_genome[i] = None
-    return child_genome
+def _log2_or_zero(values):
+    """log2 of values, 0 where value is 0."""
+    return np.log2(np.maximum(values, 1))
+
+
+def extract_features(grids, scores):
+    """Evaluate params of many boards at once, same as evaluate_move.
+
+    :param grids: np.array (N, 4, 4). Boards after a move.
+    :param scores: np.array (N,). Score earned by the move.
+    :return: np.array (N, len(WEIGHTS)), columns ordered as WEIGHTS.
+    """
+    grids = np.asarray(grids)
+    scores = np.asarray(scores)
+    # best score of a move from each board
+    boards = grids_to_boards(grids)
+    next_scores = np.max([move_boards(boards, d)[1] for d in range(4)],
+                         axis=0)
+    max_tiles = grids.max(axis=(1, 2))
+    is_max = grids == max_tiles[:, None, None]
+    rows, cols = np.indices((4, 4))
+    from_right = np.where(is_max, 3 - cols, 6).min(axis=(1, 2))
+    from_corner = np.where(is_max, 6 - rows - cols, 6).min(axis=(1, 2))
+
+    features = np.empty((len(grids), len(WEIGHTS)))
+    features[:, 0] = _log2_or_zero(max_tiles)
+    features[:, 1] = _log2_or_zero(scores)
+    features[:, 2] = (grids == 0).sum(axis=(1, 2))
+    features[:, 3] = _log2_or_zero(scores + next_scores)
+    features[:, 4] = from_right
+    features[:, 5] = from_corner
+    return features
+
+
+def genome_weights(genomes):
+    """Returns np.array of WEIGHTS values of a genome (pd.Series), or
+    2D np.array of all genomes in a pd.DataFrame. Arrays of weights
+    are returned as is."""
+    if isinstance(genomes, (pd.Series, pd.DataFrame)):
+        genomes = genomes[WEIGHTS]
+    return np.asarray(genomes, dtype=float)
+
+
+def score_moves(features, weights):
+    """Score moves by genomes weights in one matrix product.
+
+    :param features: np.array (N, len(WEIGHTS)), from extract_features.
+    :param weights: np.array (len(WEIGHTS),) of one genome, or
+    (pop, len(WEIGHTS)) of a population.
+    :return: np.array (N,), or (N, pop) for a population.
+    """
+    return features @ np.asarray(weights).T
 
 
-def evolve(generation, genomes_df):
+def breed(parents_a, parents_b, rng=None):
+    """Return child genomes, one out of every pair of parents.
+
+    :param parents_a: np.array (n, len(WEIGHTS)).
+    :param parents_b: np.array (n, len(WEIGHTS)).
+    :param rng: np.random.Generator or seed.
+    :return np.array (n, len(WEIGHTS)).
+    """
+    rng = np.random.default_rng(rng)
+    # Method: for each weight randomly choose that weight
+    # between the 2 parent genomes.
+    from_a = rng.random(parents_a.shape) < 0.5
+    children = np.where(from_a, parents_a, parents_b)
+    # Mutation step
+    mutate = rng.random(children.shape) < MUTATION_RATE
+    children += mutate * MUTATION_CHANGE * (
+            2 * rng.random(children.shape) - 1)
+    return children
+
+
+def evolve(population, fitness, rng=None):
     """Create next generation of genomes.
 
-    :param generation: int. current generation.
-    :param genomes_df: DataFrame of genomes.
-    :return DataFrame.
+    :param population: np.array (pop, len(WEIGHTS)). current generation.
+    :param fitness: np.array (pop, len(FITNESS_COLS)) of population.
+    :param rng: np.random.Generator or seed.
+    :return np.array (POPULATION_SIZE, len(WEIGHTS)).
     """
-    next_gen = pd.DataFrame(columns=genomes_df.columns)
-    # filter genomes of generation
-    curr_gen = genomes_df.loc[genomes_df['generation'] == generation].copy()
+    rng = np.random.default_rng(rng)
     # sort by highest tile and final score
-    curr_gen.sort_values(['max tile', 'final score'],
-                         ascending=[False, False], inplace=True)
+    order = np.lexsort((-fitness[:, 1], -fitness[:, 0]))
     # top (EDGES_SIZE) automatically advanced to next generation
-    next_gen = next_gen.append(curr_gen.iloc[:EDGES_SIZE, :7],
-                               ignore_index=True, sort=False)
+    elite = population[order[:EDGES_SIZE]]
     # last (EDGES_SIZE) are dropped
-    curr_gen.drop(index=curr_gen.iloc[-EDGES_SIZE:].index, inplace=True)
-    # Randomly choose 2 different parent genomes to breed
+    candidates = order[:len(order) - EDGES_SIZE]
+    # Randomly choose pairs of parent genomes to breed
     # to populate rest of generation
-    for _ in range(POPULATION_SIZE - EDGES_SIZE):
-        parent_1, parent_2 = select_parents(curr_gen)
-        child = breed(parent_1, parent_2)
-        next_gen.loc[len(next_gen)] = child
-    next_gen['generation'] = generation + 1
-    return next_gen
+    pairs = candidates[select_parents(fitness[candidates, 1],
+                                      POPULATION_SIZE - EDGES_SIZE, rng)]
+    children = breed(population[pairs[:, 0]], population[pairs[:, 1]], rng)
+    return np.vstack((elite, children))
 
 
-def select_parents(genomes_df):
-    """Select 2 genomes to breed using Accept & Reject"""
-    max_score = genomes_df['final score'].max()
-    while True:
-        parent_1 = genomes_df.sample(1)
-        if np.random.randint(max_score) < parent_1.iloc[0]['final score']:
-            break
-    while True:
-        parent_2 = genomes_df.sample(1)
-        if np.random.randint(max_score) < parent_2.iloc[0]['final score']:
-            break
+def select_parents(final_scores, n_pairs, rng=None):
+    """Select pairs of genomes to breed with the SELECTION method.
 
-    return parent_1, parent_2
+    :param final_scores: np.array (pop,).
+    :param n_pairs: int.
+    :param rng: np.random.Generator or seed.
+    :return: np.array (n_pairs, 2) of indices of final_scores.
+    """
+    return selection.METHODS[SELECTION](final_scores, n_pairs, rng)
 
 
 def play_game(session, genome):
@@ -169,33 +241,27 @@ def play_game(session, genome):
 
     moves = {'up': session.up, 'down': session.down,
              'left': session.left, 'right': session.right}
+    weights = genome_weights(genome)
     attempts = 9
     while not (session.is_game_over() or session.is_win()) and attempts > 0:
         try:
-            moves_params = {'right': dict(), 'left': dict(),
-                            'up': dict(), 'down': dict()}
-            curr_board = Board(session.current_grid)
-            curr_board.add_children()
-            # get parameters for each possible move
-            for child in curr_board.children:
-                moves_params[child.direction] = evaluate_move(child)
+            curr_grid = session.current_grid
+            if_moved = get_if_moved_grids(curr_grid)
+            directions = list(if_moved)
+            grids, scores = zip(*if_moved.values())
             # evaluate moves score based on genome
-            move_score = dict()
-            for direction, params in moves_params.items():
-                score = 0
-                for param, value in params.items():
-                    score += value * genome[param]
-                move_score[direction] = score
+            move_score = score_moves(extract_features(grids, scores),
+                                     weights)
 
             # make a move based on calculated score
-            sorted_moves = sorted(move_score, key=move_score.get, reverse=True)
-            for move in sorted_moves:
-                moves[move]()
-                if session.did_move_2(curr_board.grid):
+            for i in np.argsort(-move_score, kind='stable'):
+                moves[directions[i]]()
+                if session.did_move_2(curr_grid):
                     break
 
             attempts = 9
         except StaleElementReferenceException:
+            session.profiler.count('stale retries')
             attempts -= 1
 
     max_tile, _ = get_max_tile(session.current_grid)
@@ -204,47 +270,200 @@ def play_game(session, genome):
     return max_tile, final_score
 
 
-def main_process(generation, genomes_df):
+def evaluate_genome(genome, n_games, seed=None):
+    """Play n_games based on genome on a LocalSession.
+
+    :param genome: np.array of weights, or pd.Series.
+    :param seed: int or np.random.SeedSequence.
+    :return: list of (max_tile, final_score) tuples.
+    """
+    session = LocalSession(seed=seed)
+    results = []
+    for _ in range(n_games):
+        results.append(play_game(session, genome))
+        session.restart_game()
+    return results
+
+
+def games_fitness(results):
+    """Returns FITNESS_COLS values of (max_tile, final_score) tuples."""
+    max_tiles, final_scores = np.array(results, dtype=float).T
+    return [max_tiles.mean(), final_scores.mean(),
+            np.median(max_tiles), max_tiles.max(),
+            np.median(final_scores), final_scores.max()]
+
+
+def evaluate_population(population, n_games=GAMES_PER_GENOME, workers=None,
+                        seed=None):
+    """Play n_games per genome across worker processes.
+
+    :param population: np.array (pop, len(WEIGHTS)).
+    :param workers: int. Number of processes, default os.cpu_count().
+    :param seed: int or np.random.SeedSequence. Games of every genome
+    get a seed spawned from it.
+    :return: np.array (pop, len(FITNESS_COLS)).
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(population))
+    fitness = np.empty((len(population), len(FITNESS_COLS)))
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        all_results = pool.map(evaluate_genome, population,
+                               [n_games] * len(population), seeds)
+        for i, results in enumerate(all_results):
+            fitness[i] = games_fitness(results)
+    return fitness
+
+
+def evaluate_population_on_browser(session, population):
+    """Play one game per genome on the web game.
+
+    :return: np.array (pop, len(FITNESS_COLS)).
+    """
+    fitness = np.empty((len(population), len(FITNESS_COLS)))
+    for i, genome in enumerate(population):
+        results = [(0, 0)]
+        attempts = 7
+        while attempts > 0:
+            try:
+                results = [play_game(session, genome)]
+                session.restart_game()
+                break
+            except StaleElementReferenceException:
+                session.profiler.count('stale retries')
+                attempts -= 1
+        fitness[i] = games_fitness(results)
+        print(f'game: {i+1}')
+    return fitness
+
+
+def save_checkpoint(path, generation, population, history, rng,
+                    games_seed):
+    """Save state of an evolution run to a .npz file.
+
+    The file is written under a temporary name and then renamed, so an
+    interrupted save leaves the previous checkpoint intact.
+
+    :param generation: int. Next generation to evaluate.
+    :param population: np.array of that generation.
+    :param history: list of genomes tables of evaluated generations.
+    :param rng: np.random.Generator used by evolve.
+    :param games_seed: np.random.SeedSequence of local games.
+    """
+    history_df = pd.concat([h for h in history if len(h)], ignore_index=True)
+    state = {'rng': rng.bit_generator.state,
+             'games_seed': {'entropy': games_seed.entropy,
+                            'spawn_key': list(games_seed.spawn_key),
+                            'n_children_spawned':
+                                games_seed.n_children_spawned}}
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        np.savez(file, generation=generation, population=population,
+                 history=history_df.to_numpy(dtype=float),
+                 history_columns=np.array(history_df.columns.tolist(),
+                                          dtype=str),
+                 history_dtypes=np.array([str(dtype) for dtype
+                                          in history_df.dtypes]),
+                 state=np.array(json.dumps(state)))
+    os.replace(temp_path, path)
+
+
+def load_checkpoint(path):
+    """Load state saved by save_checkpoint.
+
+    :return: dict. generation, population, history (list with one
+    pd.DataFrame), rng and games_seed.
+    """
+    with np.load(path) as checkpoint:
+        state = json.loads(str(checkpoint['state']))
+        rng = np.random.default_rng()
+        rng.bit_generator.state = state['rng']
+        columns = checkpoint['history_columns'].tolist()
+        # history is saved as floats, give columns back their dtypes
+        history = pd.DataFrame(checkpoint['history'], columns=columns).astype(
+            dict(zip(columns, checkpoint['history_dtypes'].tolist())))
+        return {'generation': int(checkpoint['generation']),
+                'population': checkpoint['population'],
+                'history': [history],
+                'rng': rng,
+                'games_seed': np.random.SeedSequence(
+                    **state['games_seed'])}
+
+
+def main_process(generation, genomes, local=True,
+                 n_games=GAMES_PER_GENOME, workers=None, seed=None,
+                 checkpoint_path=None):
     """Play games and add new generations of genomes.
 
     :param generation: int. Which generation to start from.
-    :param genomes_df: pd.DataFrame. A table of genomes to play by.
-    :return: pd.DataFrame. A table with additional genomes
-    generations.
+    :param genomes: np.array (pop, len(WEIGHTS)) of generation, or a
+    genomes table (pd.DataFrame) with genomes of generation.
+    :param local: bool. Evaluate genomes concurrently on local games
+    (see evaluate_population), else play one game per genome on the
+    web game.
+    :param n_games: int. Games per genome when local.
+    :param workers: int. Number of processes when local.
+    :param seed: int. Seeds evolution and local games, same seed and
+    arguments give the same genomes.
+    :param checkpoint_path: str. If given, a checkpoint is saved there
+    every CHECKPOINT_EVERY generations, see resume.
+    :return: pd.DataFrame. A table of genomes of all generations, the
+    last one not evaluated yet.
     """
-    ns = Session()
-    # genomes_df = initialize_genomes_df()
-    # generation = 1
+    evolve_seed, games_seed = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(evolve_seed)
+    history = []
+    if isinstance(genomes, pd.DataFrame):
+        history.append(genomes[genomes['generation'] < generation])
+        population = population_from_df(genomes, generation)
+    else:
+        population = np.asarray(genomes, dtype=float)
+    return _evolution_loop(generation, population, history, rng, games_seed,
+                           local, n_games, workers, checkpoint_path)
+
+
+def resume(checkpoint_path, local=True, n_games=GAMES_PER_GENOME,
+           workers=None):
+    """Continue a main_process run from its checkpoint till MAX_GENERATION.
+
+    The run goes on exactly as if it wasn't interrupted: same genomes,
+    same random choices. Checkpoints keep being saved to the same path.
+    :return: pd.DataFrame. Same as main_process.
+    """
+    state = load_checkpoint(checkpoint_path)
+    return _evolution_loop(state['generation'], state['population'],
+                           state['history'], state['rng'],
+                           state['games_seed'], local, n_games, workers,
+                           checkpoint_path)
+
+
+def _evolution_loop(generation, population, history, rng, games_seed, local,
+                    n_games, workers, checkpoint_path):
+    """Evaluate and evolve generations, see main_process."""
+    ns = None if local else Session()
     while generation <= MAX_GENERATION:
-        attempts = 7
-        for i in genomes_df.index:
-            while attempts > 0:
-                try:
-                    if genomes_df.at[i, 'generation'] == generation:
-                        max_tile, final_score = play_game(ns,
-                                                          genomes_df.iloc[i])
-                        genomes_df.at[i, 'max tile'] = max_tile
-                        genomes_df.at[i, 'final score'] = final_score
-                        ns.restart_game()
-                        attempts = 7
-                        print(f'generation: {generation}, game: {i+1}')
-                        break
-                    else:
-                        break
-                except StaleElementReferenceException:
-                    attempts -= 1
-
-        next_generation = evolve(generation, genomes_df)
-        genomes_df = genomes_df.append(next_generation, ignore_index=True)
+        if local:
+            fitness = evaluate_population(population, n_games, workers,
+                                          seed=games_seed.spawn(1)[0])
+        else:
+            fitness = evaluate_population_on_browser(ns, population)
+        history.append(generation_to_df(population, generation, fitness))
+        print(f'generation: {generation}, '
+              f'mean final score: {fitness[:, 1].mean():.0f}')
+        population = evolve(population, fitness, rng)
         generation += 1
+        if checkpoint_path and generation % CHECKPOINT_EVERY == 0:
+            save_checkpoint(checkpoint_path, generation, population, history,
+                            rng, games_seed)
+    history.append(generation_to_df(population, generation))
 
-    ns.end_session()
-    return genomes_df
+    if ns is not None:
+        ns.end_session()
+    return pd.concat([h for h in history if len(h)], ignore_index=True)
 
 
 if __name__ == '__main__':
 
-    genomes = initialize_genomes_df()
-    print(main_process(1, genomes))
+    print(main_process(1, initialize_population()))
     # gene_df = pd.read_csv('genomes_20_in_gen_with_log2_only - Copy.csv')
-    # gen = evolve(141, gene_df)
+    # print(main_process(141, gene_df))
@@ -0,0 +1,212 @@
+#! python 3
+# expectimax.py - depth limited expectimax search over bitboards
+# (see bitboard.py). Max nodes pick a move, chance nodes average over
+# every empty cell getting a 2 (p=0.9) or a 4 (p=0.1).
+
+from collections import OrderedDict
+
+import numpy as np
+from selenium.common.exceptions import StaleElementReferenceException
+
+import bitboard
+
+DEPTH = 3
+# chance branches less likely than this are evaluated, not searched
+PROBABILITY_CUTOFF = 0.0001
+TABLE_SIZE = 500000
+
+# Heuristic weights, scored per row (and per column via transpose).
+LOST_PENALTY = 200000.0
+MONOTONICITY_POWER = 4.0
+MONOTONICITY_WEIGHT = 47.0
+SUM_POWER = 3.5
+SUM_WEIGHT = 11.0
+MERGES_WEIGHT = 700.0
+EMPTY_WEIGHT = 270.0
+
+
+def _build_heuristic_table():
+    """Heuristic score of all 65536 rows, computed as np.arrays."""
+    rows = np.arange(65536)
+    cells = np.stack([(rows >> (4 * c)) & 0xF for c in range(4)], axis=1)
+    cells_f = cells.astype(float)
+
+    empty = (cells == 0).sum(axis=1)
+    # adjacent equal tiles, ignoring empty cells in between
+    merges = np.zeros(65536)
+    for row_i, row in enumerate(cells.tolist()):
+        tiles = [x for x in row if x]
+        merges[row_i] = sum(1 for a, b in zip(tiles, tiles[1:]) if a == b)
+
+    powered = cells_f ** MONOTONICITY_POWER
+    diff = powered[:, 1:] - powered[:, :-1]
+    rising = np.where(cells[:, 1:] > cells[:, :-1], diff, 0).sum(axis=1)
+    falling = np.where(cells[:, 1:] < cells[:, :-1], -diff, 0).sum(axis=1)
+
+    return (LOST_PENALTY + EMPTY_WEIGHT * empty + MERGES_WEIGHT * merges
+            - MONOTONICITY_WEIGHT * np.minimum(rising, falling)
+            - SUM_WEIGHT * (cells_f ** SUM_POWER).sum(axis=1))
+
+
+_heuristic = _build_heuristic_table().tolist()
+
+
+def heuristic(board):
+    """Returns static evaluation of a bitboard."""
+    transposed = bitboard.transpose(board)
+    score = 0.0
+    for shift in (0, 16, 32, 48):
+        score += _heuristic[(board >> shift) & 0xFFFF]
+        score += _heuristic[(transposed >> shift) & 0xFFFF]
+    return score
+
+
+class TranspositionTable:
+    """Bounded map of searched positions to their value.
+
+    Least recently used entries are evicted once maxsize is reached.
+    Keys are (bitboard, depth): a value is only looked up for the same
+    board with exactly the same depth left. Chance branches less likely
+    than the cutoff are evaluated instead of searched, so a value
+    depends on the cutoff and on the probability the storing search
+    reached the board with. Reusing it for another path to the board is
+    an approximation; share a table only between searches with the same
+    cutoff.
+    With symmetric, the board is replaced by its bitboard.canonical form,
+    so all rotations and reflections of a board share an entry (the
+    heuristic, and so the search value, is the same for all of them).
+    """
+
+    def __init__(self, maxsize=TABLE_SIZE, symmetric=False):
+        self.maxsize = maxsize
+        self.symmetric = symmetric
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, board, depth):
+        """Returns cached value or None."""
+        if self.symmetric:
+            board = bitboard.canonical(board)[0]
+        key = (board, depth)
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, board, depth, value):
+        if self.symmetric:
+            board = bitboard.canonical(board)[0]
+        key = (board, depth)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class Expectimax:
+    """Expectimax search with a transposition table.
+
+    depth: int. Number of moves searched ahead.
+    cutoff: float. Chance branches with lower probability are cut off.
+    table: TranspositionTable, shared between moves of a game.
+    """
+
+    def __init__(self, depth=DEPTH, cutoff=PROBABILITY_CUTOFF, table=None):
+        self.depth = depth
+        self.cutoff = cutoff
+        self.table = table if table is not None else TranspositionTable()
+        # chance nodes expanded, for instrumentation
+        self.expanded = 0
+
+    def best_move(self, board):
+        """Returns (direction, value) of best move from bitboard.
+
+        direction is None if no move changes the board.
+        """
+        best_direction, best_value = None, -1.0
+        for direction in bitboard.DIRECTIONS:
+            moved, score = bitboard.move(board, direction)
+            if moved == board:
+                continue
+            value = score + self._chance(moved, self.depth - 1, 1.0)
+            if value > best_value:
+                best_direction, best_value = direction, value
+        return best_direction, best_value
+
+    def _max(self, board, depth, probability):
+        best = 0.0
+        for direction in bitboard.DIRECTIONS:
+            moved, score = bitboard.move(board, direction)
+            if moved != board:
+                best = max(best, score + self._chance(moved, depth - 1,
+                                                      probability))
+        return best
+
+    def _chance(self, board, depth, probability):
+        if depth <= 0 or probability < self.cutoff:
+            return heuristic(board)
+        cached = self.table.get(board, depth)
+        if cached is not None:
+            return cached
+
+        empty = [i for i in range(16) if not (board >> (4 * i)) & 0xF]
+        if not empty:
+            return heuristic(board)
+        self.expanded += 1
+        probability /= len(empty)
+        value = 0.0
+        for i in empty:
+            value += 0.9 * self._max(board | (1 << (4 * i)), depth,
+                                     probability * 0.9)
+            value += 0.1 * self._max(board | (2 << (4 * i)), depth,
+                                     probability * 0.1)
+        value /= len(empty)
+
+        self.table.put(board, depth, value)
+        return value
+
+
+def expectimax_game(session, depth=DEPTH, searcher=None, rng=None):
+    """Play a game.
+
+    Strategy: Expectimax search depth moves ahead, including the
+    random tile spawns.
+
+    :param session: Session object.
+    :param depth: int.
+    :param searcher: Expectimax object, overrides depth.
+    :param rng: unused, kept for the common strategy interface.
+    :return: (Score, Highest tile, Number of moves)
+    """
+    moves = {'right': session.right, 'left': session.left,
+             'up': session.up, 'down': session.down}
+    searcher = searcher or Expectimax(depth=depth)
+
+    moves_count = 0
+    attempts = 7
+    while not (session.is_game_over() or session.is_win()) and attempts > 0:
+        try:
+            board = bitboard.from_grid(session.current_grid)
+            expanded = searcher.expanded
+            direction, _ = searcher.best_move(board)
+            session.profiler.count('tree nodes', searcher.expanded - expanded)
+            if direction is None:
+                break
+            moves[direction]()
+            moves_count += 1
+            attempts = 7
+        except StaleElementReferenceException:
+            session.profiler.count('stale retries')
+            attempts -= 1
+    return (session.get_score(),
+            int(np.amax(session.current_grid)),
+            moves_count)
@@ -0,0 +1,145 @@
+#! python 3
+# game_trace.py - record games move by move in a compact binary file.
+# A trace file is a plain array of TRACE_DTYPE records (23 bytes each)
+# that is only ever appended to, so it can be memory-mapped with
+# load_trace while being written.
+# Usage: session.recorder = TraceWriter('games.trace'); play games;
+# session.recorder.close(). A recorded game can be played again
+# exactly with replay_game.
+
+import os
+
+import numpy as np
+
+import bitboard
+from simulateGame import LocalSession
+
+TRACE_DTYPE = np.dtype([('game', '<u4'),         # game number in file
+                        ('step', '<u4'),         # move number in game
+                        ('board', '<u8'),        # bitboard before move
+                        ('move', 'u1'),          # bitboard.DIRECTIONS index
+                        ('score', '<u4'),        # score earned by move
+                        ('spawn_cell', 'i1'),    # 4 * row + col, -1 unknown
+                        ('spawn_value', 'u1')])  # log2 of spawned tile
+BUFFER_SIZE = 4096
+
+
+class TraceWriter:
+    """Appends moves of games to a trace file.
+
+    path: str. Trace file, created if missing. Game numbers continue
+    after the last game already in the file.
+    buffer_size: int. Number of records kept in memory between writes.
+    """
+
+    def __init__(self, path, buffer_size=BUFFER_SIZE):
+        self.path = path
+        self.buffer = np.zeros(buffer_size, dtype=TRACE_DTYPE)
+        self.size = 0
+        existing = load_trace(path) if os.path.exists(path) else []
+        self.game = int(existing[-1]['game']) + 1 if len(existing) else 0
+        if os.path.exists(path):
+            # drop a partly written last record, so appended records
+            # start at a record boundary
+            os.truncate(path, len(existing) * TRACE_DTYPE.itemsize)
+        del existing
+        self.step = 0
+        self.file = open(path, 'ab')
+
+    def new_game(self):
+        """Following moves belong to a new game."""
+        if self.step:
+            self.game += 1
+            self.step = 0
+
+    def record(self, board, direction, score, spawn_cell, spawn_value):
+        """Add a move.
+
+        :param board: bitboard (int) or np.array of board before move.
+        :param direction: str.
+        :param score: int. Score earned by move.
+        :param spawn_cell: int. 4 * row + col of new tile, -1 if unknown.
+        :param spawn_value: int. Value of new tile (2 or 4), 0 if unknown.
+        """
+        if not isinstance(board, int):
+            board = bitboard.from_grid(board)
+        self.buffer[self.size] = (self.game, self.step, board,
+                                  bitboard.DIRECTIONS.index(direction),
+                                  score, spawn_cell,
+                                  int(spawn_value).bit_length() - 1
+                                  if spawn_value else 0)
+        self.size += 1
+        self.step += 1
+        if self.size == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        """Write buffered records to file."""
+        self.file.write(self.buffer[:self.size].tobytes())
+        self.file.flush()
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_trace(path, mode='r'):
+    """Returns memory-mapped array of TRACE_DTYPE records of a file."""
+    # a partly written last record is left out
+    n_records = os.path.getsize(path) // TRACE_DTYPE.itemsize
+    if n_records == 0:
+        return np.zeros(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode=mode, shape=n_records)
+
+
+def game_records(trace, game):
+    """Returns records of one game out of a loaded trace."""
+    return trace[trace['game'] == game]
+
+
+class ReplaySession(LocalSession):
+    """LocalSession whose tiles spawn as recorded in a trace.
+
+    Starts from the first recorded board, and every move that changes
+    the board spawns the tile of the next record.
+    records: TRACE_DTYPE records of one game (see game_records).
+    """
+
+    def __init__(self, records):
+        self.records = records
+        super().__init__()
+
+    def restart_game(self):
+        self.current_grid = bitboard.to_grid(int(self.records[0]['board']))
+        self.score = 0
+        self._spawns = iter(self.records[['spawn_cell', 'spawn_value']])
+
+    def add_random_tile(self):
+        """Put the next recorded tile on its recorded cell."""
+        cell, value = next(self._spawns)
+        if cell < 0:
+            raise ValueError('spawned tile was not recorded')
+        self.current_grid.flat[cell] = 1 << int(value)
+
+
+def replay_game(records):
+    """Play a recorded game again, checking every board on the way.
+
+    :param records: TRACE_DTYPE records of one game.
+    :return: (Score, Highest tile, Number of moves)
+    """
+    session = ReplaySession(records)
+    for step, record in enumerate(records):
+        if bitboard.from_grid(session.current_grid) != int(record['board']):
+            raise ValueError(f'board differs from record at step {step}')
+        getattr(session, bitboard.DIRECTIONS[record['move']])()
+    return (session.get_score(),
+            session.get_highest_tile(),
+            len(records))
@@ -0,0 +1,153 @@
+#! python 3
+# instrumentation.py - opt-in timing of the phases of a game loop
+# (thinking, sending keys, reading the page) and counters (moves, stale
+# element retries, tree nodes expanded).
+# Sessions report to session.profiler, which is NULL_PROFILER unless a
+# Profiler is set, so the game loops pay almost nothing by default.
+# Usage:
+#     ns.profiler = Profiler()
+#     two_step_score_greedy_no_left_game(ns)
+#     print(ns.profiler.summaries())
+#     ns.profiler.export_chrome_trace('trace.json')  # chrome://tracing
+
+import contextlib
+import json
+import time
+from collections import Counter
+
+import pandas as pd
+
+# Phase names used by the sessions.
+THINK = 'think'
+KEY_SEND = 'key send'
+DOM_READ = 'dom read'
+MOVE_SCRIPT = 'move script'
+ENGINE_MOVE = 'engine move'
+
+
+class _Phase:
+    """Context manager timing a phase of a Profiler."""
+
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.start(self.name)
+
+    def __exit__(self, *exc_info):
+        self.profiler.stop(self.name)
+
+
+class Profiler:
+    """Records timed phases and counters, per game.
+
+    A phase is timed either by `with profiler.phase(name):` or by
+    start(name) and stop(name), e.g. think time from the end of a move
+    to the start of the next one. Game 0 starts on creation, every
+    new_game starts the next one.
+
+    clock: function that returns seconds, default time.perf_counter.
+    """
+
+    # game loops check it before work done only to be counted
+    enabled = True
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        # (game, phase, start, duration) of every timed phase
+        self.events = []
+        self.counters = []
+        self._started = dict()
+        self.game = -1
+        self.new_game()
+
+    def new_game(self):
+        """Start recording the next game, phases still running are
+        dropped."""
+        self.game += 1
+        self.counters.append(Counter())
+        self._started.clear()
+
+    def start(self, name):
+        self._started[name] = self.clock()
+
+    def stop(self, name):
+        """Stop timing phase name, ignored if it wasn't started."""
+        start = self._started.pop(name, None)
+        if start is not None:
+            self.events.append((self.game, name, start,
+                                self.clock() - start))
+
+    def phase(self, name):
+        """Returns context manager timing phase name."""
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        """Add n to counter name of the current game."""
+        self.counters[self.game][name] += n
+
+    def summary(self, game=None):
+        """Returns dict of total seconds and calls of every phase, and
+        the counters, of a game (default current game)."""
+        game = self.game if game is None else game
+        summary = dict()
+        for event_game, name, _, duration in self.events:
+            if event_game == game:
+                summary[f'{name} seconds'] = (
+                    summary.get(f'{name} seconds', 0.0) + duration)
+                summary[f'{name} calls'] = summary.get(f'{name} calls', 0) + 1
+        summary.update(self.counters[game])
+        return summary
+
+    def summaries(self):
+        """Returns pd.DataFrame of summary of every game that has events
+        or counters, a row per game."""
+        rows = {game: self.summary(game) for game in range(self.game + 1)}
+        return pd.DataFrame.from_dict(
+            {game: row for game, row in rows.items() if row},
+            orient='index').fillna(0)
+
+    def export_chrome_trace(self, path):
+        """Write events in Chrome trace event format (chrome://tracing,
+        Perfetto), a thread per game."""
+        origin = min((start for _, _, start, _ in self.events), default=0)
+        trace = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': game,
+                  'ts': (start - origin) * 1e6, 'dur': duration * 1e6}
+                 for game, name, start, duration in self.events]
+        trace += [{'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': game,
+                   'args': {'name': f'game {game}'}}
+                  for game in range(self.game + 1)]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': trace,
+                       'otherData': {f'game {game}': dict(counters)
+                                     for game, counters
+                                     in enumerate(self.counters)}},
+                      file)
+
+
+class NullProfiler:
+    """Profiler that records nothing."""
+
+    enabled = False
+    _phase = contextlib.nullcontext()
+
+    def new_game(self):
+        pass
+
+    def start(self, name):
+        pass
+
+    def stop(self, name):
+        pass
+
+    def phase(self, name):
+        return self._phase
+
+    def count(self, name, n=1):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,174 @@
+#! python 3
+# microbenchmark.py - time the move kernel and tree expansion functions
+# of simulateGame over a corpus of mid-game and late-game boards, and
+# check alternative engines (bitboard, batch_game, BoardNode,
+# MovesCache) against them for correctness and speed.
+
+import time
+
+import numpy as np
+
+import simulateGame as sg
+import bitboard
+import batch_game
+
+REPEAT = 5
+DIRECTIONS = bitboard.DIRECTIONS
+
+
+class _CorpusSession(sg.LocalSession):
+    """LocalSession that keeps every board it moved from."""
+
+    def __init__(self, seed=None):
+        self.boards = []
+        super().__init__(seed=seed)
+
+    def _move(self, direction):
+        self.boards.append(self.current_grid.copy())
+        super()._move(direction)
+
+
+def build_corpus(n_games=4, seed=0, size=200):
+    """Play games of two_step_score_greedy_no_left_game to collect boards.
+
+    :return: dict. 'mid' boards (highest tile 128 or 256) and 'late'
+    boards (highest tile 512 and above), each a list of size np.arrays.
+    """
+    boards = []
+    for game_seed in np.random.SeedSequence(seed).spawn(n_games):
+        spawn_seed, moves_seed = game_seed.spawn(2)
+        session = _CorpusSession(seed=spawn_seed)
+        sg.two_step_score_greedy_no_left_game(session, rng=moves_seed)
+        boards.extend(session.boards)
+    highest = np.array([b.max() for b in boards])
+    rng = np.random.default_rng(seed)
+    corpus = dict()
+    for name, mask in (('mid', (highest >= 128) & (highest <= 256)),
+                       ('late', highest >= 512)):
+        index = np.flatnonzero(mask)
+        chosen = rng.choice(index, size=min(size, len(index)), replace=False)
+        corpus[name] = [boards[i] for i in chosen]
+    return corpus
+
+
+def _time(func, items, repeat=REPEAT):
+    """Best time per item, in microseconds, of calling func(item)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def _expand(board, levels):
+    """Build Board tree levels deep and return it."""
+    board.add_children()
+    if levels > 1:
+        board.add_grandchildren()
+    return board
+
+
+def _tree_scores(board):
+    return sorted((d, int(s)) for d, s in sg.get_potential_moves_score(board))
+
+
+def kernel_benchmarks(grids):
+    """Time the current implementation of every hot function.
+
+    :return: dict. name -> microseconds per call.
+    """
+    rows = [grid[i, :] for grid in grids for i in range(4)]
+    pairs = [(grid, d) for grid in grids for d in DIRECTIONS]
+    no_cache = sg.MovesCache(maxsize=0)
+    cached = sg.MovesCache()
+    default_cache = sg.Board.cache
+    results = {
+        'move_row': _time(sg.move_row, rows),
+        'move_row_with_score': _time(sg.move_row_with_score, rows),
+        'get_board_if_move': _time(lambda p: sg.get_board_if_move(*p),
+                                   pairs),
+        'get_board_if_move_with_score': _time(
+            lambda p: sg.get_board_if_move_with_score(*p), pairs),
+        'get_if_moved_grids': _time(sg.get_if_moved_grids, grids),
+        'bitboard.canonical': _time(bitboard.canonical,
+                                    [bitboard.from_grid(g) for g in grids]),
+    }
+    try:
+        sg.Board.cache = no_cache
+        results['Board.add_children'] = _time(
+            lambda g: _expand(sg.Board(g), 1), grids)
+        results['Board.add_grandchildren'] = _time(
+            lambda g: _expand(sg.Board(g), 2), grids)
+        trees = [_expand(sg.Board(g), 2) for g in grids]
+        results['get_potential_moves_score'] = _time(
+            sg.get_potential_moves_score, trees)
+        sg.Board.cache = cached
+        results['Board.add_grandchildren (warm MovesCache)'] = _time(
+            lambda g: _expand(sg.Board(g), 2), grids)
+        sg.Board.cache = sg.MovesCache(symmetric=True)
+        results['Board.add_grandchildren (symmetric)'] = _time(
+            lambda g: _expand(sg.Board(g), 2), grids)
+    finally:
+        sg.Board.cache = default_cache
+    return results
+
+
+def engine_benchmarks(grids):
+    """Check alternative engines against the current implementation.
+
+    :return: dict. name -> (microseconds per board, bool correct).
+    """
+    boards = [bitboard.from_grid(g) for g in grids]
+    expected = [sg.get_if_moved_grids(g) for g in grids]
+
+    def bitboard_moves(board):
+        return {d: bitboard.move(board, d) for d in DIRECTIONS}
+
+    correct = all(
+        np.array_equal(bitboard.to_grid(bitboard_moves(b)[d][0]), e[d][0])
+        and bitboard_moves(b)[d][1] == e[d][1]
+        for b, e in zip(boards, expected) for d in DIRECTIONS)
+    results = {'bitboard.move x4': (_time(bitboard_moves, boards), correct)}
+
+    batch = batch_game.grids_to_boards(np.array(grids))
+    moved = [batch_game.move_boards(batch, d) for d in range(4)]
+    correct = all(
+        np.array_equal(batch_game.boards_to_grids(moved[d][0])[i],
+                       expected[i][DIRECTIONS[d]][0])
+        and moved[d][1][i] == expected[i][DIRECTIONS[d]][1]
+        for i in range(len(grids)) for d in range(4))
+    seconds = _time(lambda b: [batch_game.move_boards(b, d)
+                               for d in range(4)], [batch])
+    results['batch_game.move_boards x4'] = (seconds / len(grids), correct)
+
+    default_cache = sg.Board.cache
+    try:
+        sg.Board.cache = sg.MovesCache(maxsize=0)
+        reference = [_tree_scores(_expand(sg.Board(g), 2)) for g in grids]
+    finally:
+        sg.Board.cache = default_cache
+    # BoardNode leaves out moves that don't change the board
+    correct = all(
+        set(_tree_scores(sg.BoardNode(b))) <= set(r)
+        for b, r in zip(boards, reference))
+    results['BoardNode two-level tree'] = (
+        _time(lambda b: sg.get_potential_moves_score(sg.BoardNode(b)),
+              boards), correct)
+    return results
+
+
+def main():
+    corpus = build_corpus()
+    for name, grids in corpus.items():
+        print(f'--- {name} game boards ({len(grids)}) ---')
+        for func, us in kernel_benchmarks(grids).items():
+            print(f'{func:40} {us:10.2f} us')
+        for engine, (us, correct) in engine_benchmarks(grids).items():
+            status = 'ok' if correct else 'MISMATCH'
+            print(f'{engine:40} {us:10.2f} us  {status}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#! python 3
+# mock_server.py - serve a local stand-in of the 2048 web game
+# (mock_2048.html) so the Selenium path can be tested and load-tested
+# without network access.
+# Usage:
+#     with MockServer() as server:
+#         ns = simulateGame.Session(url=server.url(seed=1))
+# or run this file to serve on MOCK_PORT until interrupted.
+
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_PORT = 8048
+PAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'mock_2048.html')
+
+
+class _PageHandler(BaseHTTPRequestHandler):
+    """Serves the game page for every GET request."""
+
+    page = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.page)))
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer:
+    """Local HTTP server of the game page, run in a background thread.
+
+    port: int. 0 picks a free port.
+    """
+
+    def __init__(self, port=0):
+        with open(PAGE_PATH, 'rb') as file:
+            handler = type('PageHandler', (_PageHandler,),
+                           {'page': file.read()})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def url(self, seed=None, sync=False):
+        """Returns url of the game page.
+
+        seed: int. Makes tile spawns repeatable.
+        sync: bool. Draw every move right away, instead of in animation
+        frames like the real page.
+        """
+        query = []
+        if seed is not None:
+            query.append(f'seed={seed}')
+        if sync:
+            query.append('sync=1')
+        return f'http://127.0.0.1:{self.port}/' + (
+            '?' + '&'.join(query) if query else '')
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    server = MockServer(MOCK_PORT)
+    print(f'Serving 2048 on {server.url()}')
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
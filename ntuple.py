@@ -0,0 +1,182 @@
+#! python 3
+# ntuple.py - n-tuple network value function of bitboards (see
+# bitboard.py), trained by TD(0) on afterstates (the board right after
+# a move, before the random tile).
+# A tuple is 4 cells; the exponents in them index a table of 16 ** 4
+# weights. Every tuple is sampled in all 8 rotations and reflections of
+# the board, sharing one table, and the value of a board is the sum of
+# the looked up weights.
+# Usage:
+#     network = NTupleNetwork()
+#     train(network, 10000, seed=1)
+#     network.save(WEIGHTS_PATH)
+#     ntuple_game(session, NTupleNetwork.load(WEIGHTS_PATH))
+
+import numpy as np
+from selenium.common.exceptions import StaleElementReferenceException
+
+import bitboard
+from batch_game import board_exponents
+
+WEIGHTS_PATH = 'ntuple_weights.npy'
+LEARNING_RATE = 0.1
+# cells (4 * row + col) of the tuples: 2 lines and 3 squares
+TUPLES = [(0, 1, 2, 3),
+          (4, 5, 6, 7),
+          (0, 1, 4, 5),
+          (1, 2, 5, 6),
+          (5, 6, 9, 10)]
+
+
+def _symmetries(cells):
+    """Returns the 8 rotations and reflections of a tuple of cells."""
+    coords = [divmod(cell, 4) for cell in cells]
+    variants = []
+    for _ in range(4):
+        coords = [(col, 3 - row) for row, col in coords]
+        variants.append([4 * row + col for row, col in coords])
+        variants.append([4 * row + 3 - col for row, col in coords])
+    return variants
+
+
+# _CELLS[i]: cells of the i-th sampled tuple, _TABLE[i]: its weights table
+_CELLS = np.array([variant for cells in TUPLES
+                   for variant in _symmetries(cells)])
+_TABLE = np.repeat(np.arange(len(TUPLES)), 8)
+_PLACE = 16 ** np.arange(4)
+
+
+def _indices(boards):
+    """Returns (N, len(_CELLS)) table indices of np.uint64 bitboards."""
+    return board_exponents(boards)[:, _CELLS] @ _PLACE
+
+
+class NTupleNetwork:
+    """Value function of afterstates.
+
+    weights: np.array (len(TUPLES), 16 ** 4) of float32, default zeros.
+    """
+
+    def __init__(self, weights=None):
+        if weights is None:
+            weights = np.zeros((len(TUPLES), 16 ** 4), dtype=np.float32)
+        self.weights = weights
+
+    def evaluate(self, boards):
+        """Returns np.array of values of a np.uint64 array of bitboards."""
+        return self.weights[_TABLE, _indices(boards)].sum(axis=1)
+
+    def value(self, board):
+        """Returns value of a bitboard (int)."""
+        return float(self.evaluate(np.array([board], dtype=np.uint64))[0])
+
+    def update(self, board, error, learning_rate=LEARNING_RATE):
+        """Move value of board by learning_rate * error, split between
+        the weights it looks up."""
+        index = _indices(np.array([board], dtype=np.uint64))[0]
+        np.add.at(self.weights, (_TABLE, index),
+                  learning_rate * error / len(_TABLE))
+
+    def best_afterstate(self, board):
+        """Returns (direction, afterstate, score, value) of the move with
+        highest score + value, direction is None if no move is possible.
+        """
+        moves = []
+        for direction in bitboard.DIRECTIONS:
+            moved, score = bitboard.move(board, direction)
+            if moved != board:
+                moves.append((direction, moved, score))
+        if not moves:
+            return None, board, 0, 0.0
+        values = self.evaluate(np.array([moved for _, moved, _ in moves],
+                                        dtype=np.uint64))
+        best = int(np.argmax([score for _, _, score in moves] + values))
+        direction, moved, score = moves[best]
+        return direction, moved, score, float(values[best])
+
+    def save(self, path=WEIGHTS_PATH):
+        np.save(path, self.weights)
+
+    @classmethod
+    def load(cls, path=WEIGHTS_PATH, mmap_mode='r'):
+        """Load weights saved by save.
+
+        :param mmap_mode: 'r' maps the file read only, for playing. Use
+        'r+' (or None to load into memory) to train further.
+        """
+        return cls(np.load(path, mmap_mode=mmap_mode))
+
+
+def _add_random_tile(board, rng):
+    """Put a 2 or 4 tile on a random empty cell of a bitboard."""
+    empty = [i for i in range(16) if not (board >> (4 * i)) & 0xF]
+    cell = empty[rng.integers(len(empty))]
+    return board | ((1 if rng.random() < 0.9 else 2) << (4 * cell))
+
+
+def train(network, n_games, learning_rate=LEARNING_RATE, seed=None):
+    """Train network by TD(0) on afterstates of n_games local games.
+
+    Every move's afterstate value is moved towards the score of the next
+    move plus the value of the next afterstate (0 when the game is over).
+    Games go on past 2048.
+
+    :param network: NTupleNetwork with writable weights.
+    :param seed: int or np.random.Generator. Seed of tile spawns.
+    :return: np.array of (score, highest tile) of every game.
+    """
+    rng = np.random.default_rng(seed)
+    results = np.zeros((n_games, 2), dtype=np.int64)
+    for game in range(n_games):
+        board = _add_random_tile(_add_random_tile(0, rng), rng)
+        score = 0
+        afterstate, value = None, 0.0
+        while True:
+            direction, moved, reward, next_value = network.best_afterstate(
+                board)
+            if direction is None:
+                break
+            if afterstate is not None:
+                network.update(afterstate, reward + next_value - value,
+                               learning_rate)
+            afterstate, value = moved, next_value
+            score += reward
+            board = _add_random_tile(moved, rng)
+        if afterstate is not None:
+            network.update(afterstate, -value, learning_rate)
+        results[game] = score, 1 << bitboard.max_exponent(board)
+    return results
+
+
+def ntuple_game(session, network=None, rng=None):
+    """Play a game.
+
+    Strategy: Move to the afterstate with highest score + value by an
+    n-tuple network.
+
+    :param session: Session object.
+    :param network: NTupleNetwork, default the one saved in WEIGHTS_PATH.
+    :param rng: unused, kept for the common strategy interface.
+    :return: (Score, Highest tile, Number of moves)
+    """
+    moves = {'right': session.right, 'left': session.left,
+             'up': session.up, 'down': session.down}
+    network = network or NTupleNetwork.load()
+
+    moves_count = 0
+    attempts = 7
+    while not (session.is_game_over() or session.is_win()) and attempts > 0:
+        try:
+            board = bitboard.from_grid(session.current_grid)
+            direction, _, _, _ = network.best_afterstate(board)
+            if direction is None:
+                break
+            moves[direction]()
+            moves_count += 1
+            attempts = 7
+        except StaleElementReferenceException:
+            session.profiler.count('stale retries')
+            attempts -= 1
+    return (session.get_score(),
+            int(np.amax(session.current_grid)),
+            moves_count)
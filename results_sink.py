@@ -0,0 +1,182 @@
+#! python 3
+# results_sink.py - append game results to a file in the data.txt format
+# (strategy,score,highest_tile,moves_count) and keep running statistics
+# of every strategy, so they can be read while games are still played
+# and a run can stop once the mean score is known well enough.
+# Usage:
+#     with ResultsSink('data.txt') as sink:
+#         sink.extend(collectData.play_games('fp', 10))
+#         print(sink.summary())
+
+import math
+import os
+from collections import Counter
+
+import pandas as pd
+
+# relative accuracy of score quantiles
+QUANTILE_ACCURACY = 0.01
+# z value of the confidence interval of the mean score (95%)
+CONFIDENCE_Z = 1.96
+# stop when the confidence interval is narrower than this part of the mean
+REL_WIDTH = 0.05
+MIN_GAMES = 30
+
+
+class QuantileSketch:
+    """Histogram of values in logarithmic buckets.
+
+    Every quantile is within QUANTILE_ACCURACY of its true value
+    (relative), in memory that grows with log of the range of values
+    rather than with their number.
+    """
+
+    def __init__(self, accuracy=QUANTILE_ACCURACY):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.buckets[math.ceil(math.log(value) / self.log_gamma)] += 1
+
+    def quantile(self, q):
+        """Returns estimate of the q quantile (0 <= q <= 1), None if empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class RunningStats:
+    """Statistics of the games of one strategy, updated one game at a time.
+
+    Mean and variance of the score use Welford's algorithm.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.max_score = None
+        self.moves_total = 0
+        self.tile_counts = Counter()
+        self.sketch = QuantileSketch()
+
+    def add(self, score, highest_tile, moves_count):
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (score - self.mean)
+        self.max_score = (score if self.max_score is None
+                          else max(self.max_score, score))
+        self.moves_total += moves_count
+        self.tile_counts[highest_tile] += 1
+        self.sketch.add(score)
+
+    @property
+    def variance(self):
+        """Sample variance of the score."""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def confidence_interval(self, z=CONFIDENCE_Z):
+        """Returns (low, high) of the confidence interval of mean score."""
+        if self.count < 2:
+            return -math.inf, math.inf
+        half_width = z * self.std / math.sqrt(self.count)
+        return self.mean - half_width, self.mean + half_width
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def summary(self):
+        low, high = self.confidence_interval()
+        return {'games': self.count,
+                'score mean': self.mean,
+                'score std': self.std,
+                'ci low': low,
+                'ci high': high,
+                'score median': self.quantile(0.5),
+                'score p90': self.quantile(0.9),
+                'max score': self.max_score,
+                'moves mean': self.moves_total / self.count,
+                'most common tile': self.tile_counts.most_common(1)[0][0]}
+
+
+class ResultsSink:
+    """Append only results file with RunningStats of every strategy.
+
+    Results already in path are read once, line by line, into the stats.
+
+    path: str. File of strategy,score,highest_tile,moves_count rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stats = dict()
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    if line.strip():
+                        strategy_type, *values = line.strip().split(',')
+                        self._update(strategy_type, *map(int, values))
+        self.file = open(path, 'a')
+
+    def _update(self, strategy_type, score, highest_tile, moves_count):
+        if strategy_type not in self.stats:
+            self.stats[strategy_type] = RunningStats()
+        self.stats[strategy_type].add(score, highest_tile, moves_count)
+
+    def add(self, strategy_type, score, highest_tile, moves_count):
+        """Append a game's result and update its strategy's stats."""
+        self.file.write(f'{strategy_type},{score},{highest_tile},'
+                        f'{moves_count}\n')
+        self._update(strategy_type, score, highest_tile, moves_count)
+
+    def extend(self, results):
+        """Add (strategy, score, highest_tile, moves_count) rows, e.g. a
+        list returned by collectData.play_games."""
+        for row in results:
+            self.add(*row)
+        self.file.flush()
+
+    def should_stop(self, strategy_type, rel_width=REL_WIDTH,
+                    min_games=MIN_GAMES):
+        """True once the confidence interval of the strategy's mean score
+        is narrower than rel_width of the mean."""
+        stats = self.stats.get(strategy_type)
+        if stats is None or stats.count < min_games:
+            return False
+        low, high = stats.confidence_interval()
+        return high - low <= rel_width * abs(stats.mean)
+
+    def summary(self):
+        """Returns pd.DataFrame of the stats, a row per strategy."""
+        return pd.DataFrame.from_dict(
+            {name: stats.summary() for name, stats in self.stats.items()},
+            orient='index')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
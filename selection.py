@@ -0,0 +1,70 @@
+#! python 3
+# selection.py - parent selection methods for the genetic algorithm.
+# Each method draws all parent pairs of a generation in one vectorized
+# call and returns a (n_pairs, 2) array of indices into fitness.
+
+import numpy as np
+
+TOURNAMENT_SIZE = 3
+
+
+def _weights(fitness):
+    """Returns fitness as non negative float weights.
+
+    If no genome has positive fitness all get the same weight, so
+    selection falls back to uniform instead of failing.
+    """
+    weights = np.clip(np.asarray(fitness, dtype=float), 0, None)
+    if not weights.sum() > 0:
+        return np.ones(len(weights))
+    return weights
+
+
+def roulette_wheel(fitness, n_pairs, rng=None):
+    """Fitness proportional selection (cumulative sum + searchsorted).
+
+    :param fitness: np.array (pop,).
+    :param n_pairs: int.
+    :param rng: np.random.Generator or seed.
+    :return: np.array (n_pairs, 2) of indices.
+    """
+    rng = np.random.default_rng(rng)
+    cumulative = np.cumsum(_weights(fitness))
+    points = rng.random(2 * n_pairs) * cumulative[-1]
+    index = np.searchsorted(cumulative, points, side='right')
+    return index.reshape(n_pairs, 2)
+
+
+def stochastic_universal_sampling(fitness, n_pairs, rng=None):
+    """Fitness proportional selection with evenly spaced pointers.
+
+    Same expected counts as roulette_wheel, but every genome is picked
+    within one of its expected count.
+    :return: np.array (n_pairs, 2) of indices.
+    """
+    rng = np.random.default_rng(rng)
+    cumulative = np.cumsum(_weights(fitness))
+    step = cumulative[-1] / (2 * n_pairs)
+    points = rng.random() * step + step * np.arange(2 * n_pairs)
+    index = np.searchsorted(cumulative, points, side='right')
+    # pointers come out sorted, shuffle them into random pairs
+    return rng.permutation(index).reshape(n_pairs, 2)
+
+
+def tournament(fitness, n_pairs, rng=None, size=TOURNAMENT_SIZE):
+    """Each parent is the fittest of size randomly drawn genomes.
+
+    :param size: int. Number of genomes in a tournament.
+    :return: np.array (n_pairs, 2) of indices.
+    """
+    rng = np.random.default_rng(rng)
+    fitness = np.asarray(fitness, dtype=float)
+    entrants = rng.integers(len(fitness), size=(2 * n_pairs, size))
+    winners = entrants[np.arange(2 * n_pairs),
+                       np.argmax(fitness[entrants], axis=1)]
+    return winners.reshape(n_pairs, 2)
+
+
+METHODS = {'roulette': roulette_wheel,
+           'sus': stochastic_universal_sampling,
+           'tournament': tournament}
@@ -0,0 +1,110 @@
+#! python 3
+# session_pool.py - play games concurrently on a pool of browser
+# sessions. WebDriver calls block, so every game runs in a worker
+# thread; an asyncio queue hands free sessions to waiting games so
+# the latency of one browser overlaps with the others.
+# Usage:
+#     results = play_concurrently('2ssgnl', n_games=20, size=4)
+# or, inside a coroutine:
+#     async with SessionPool(4) as pool:
+#         await pool.run(evolving_algorithm.play_game, genome)
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from simulateGame import Session, STRATEGIES, url2048
+
+POOL_SIZE = 4
+
+
+class SessionPool:
+    """Pool of size sessions to run games on.
+
+    size: int. Number of browser sessions.
+    url: str. Game page, e.g. a local stand-in of the web game.
+    session_factory: callable that gets url and returns a session,
+    default Session.
+    """
+
+    def __init__(self, size=POOL_SIZE, url=url2048, session_factory=Session):
+        self.size = size
+        self.url = url
+        self.session_factory = session_factory
+        self.sessions = []
+        self.executor = None
+        self.free = None
+
+    async def start(self):
+        """Open all sessions concurrently."""
+        loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.size)
+        self.free = asyncio.Queue()
+        self.sessions = await asyncio.gather(*[
+            loop.run_in_executor(self.executor, self.session_factory,
+                                 self.url)
+            for _ in range(self.size)])
+        for session in self.sessions:
+            self.free.put_nowait(session)
+
+    async def close(self):
+        """Close all sessions."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self.executor, session.end_session)
+            for session in self.sessions])
+        self.executor.shutdown()
+        self.sessions = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def run(self, game, *args, **kwargs):
+        """Play game(session, *args, **kwargs) on the next free session.
+
+        The session's game is restarted before it goes back to the pool.
+        :return: whatever game returns.
+        """
+        loop = asyncio.get_running_loop()
+        session = await self.free.get()
+        try:
+            return await loop.run_in_executor(
+                self.executor, functools.partial(game, session, *args,
+                                                 **kwargs))
+        finally:
+            await loop.run_in_executor(self.executor, session.restart_game)
+            self.free.put_nowait(session)
+
+    async def run_strategy(self, strategy_type, n_games, seed=None):
+        """Play n_games of a strategy from simulateGame.STRATEGIES.
+
+        :return: list of (strategy_type, score, highest_tile, moves_count)
+        in the order the games were scheduled.
+        """
+        strategy = STRATEGIES[strategy_type]
+        seeds = np.random.SeedSequence(seed).spawn(n_games)
+        results = await asyncio.gather(*[
+            self.run(strategy, rng=np.random.default_rng(game_seed))
+            for game_seed in seeds])
+        return [(strategy_type, int(score), int(highest_tile),
+                 int(moves_count))
+                for score, highest_tile, moves_count in results]
+
+
+def play_concurrently(strategy_type, n_games, size=POOL_SIZE, url=url2048,
+                      seed=None, session_factory=Session):
+    """Play n_games of a strategy on a new pool of size sessions.
+
+    :return: list of (strategy_type, score, highest_tile, moves_count).
+    """
+    async def play():
+        async with SessionPool(size, url, session_factory) as pool:
+            return await pool.run_strategy(strategy_type, n_games, seed)
+
+    return asyncio.run(play())
@@ -11,80 +11,212 @@ from selenium.common.exceptions import StaleElementReferenceException
 import numpy as np
 import itertools
 
+import bitboard
+from expectimax import expectimax_game
+from instrumentation import (NULL_PROFILER, THINK, KEY_SEND, DOM_READ,
+                             MOVE_SCRIPT, ENGINE_MOVE)
+
+import threading
 import time
+from collections import OrderedDict
 
 url2048 = 'https://play2048.co/'
+# Boards rarely repeat across games, nearly all hits come from the last
+# few moves, so a small cache (about 1.7 KB per board) is enough.
+MOVES_CACHE_SIZE = 4096
+ARROW_KEYS = {'right': Keys.ARROW_RIGHT, 'left': Keys.ARROW_LEFT,
+              'up': Keys.ARROW_UP, 'down': Keys.ARROW_DOWN}
+# Reads tiles, score and game message of the page in one round trip.
+# Tile classes look like 'tile tile-8 tile-position-2-3 tile-new',
+# position is column-row counted from 1.
+READ_STATE_JS = '''
+var grid = [[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]];
+var tiles = document.querySelectorAll('.tile-container > .tile');
+for (var i = 0; i < tiles.length; i++) {
+    var value = 0, col = 0, row = 0;
+    tiles[i].className.split(' ').forEach(function (name) {
+        var position = name.match(/^tile-position-(\\d)-(\\d)$/);
+        if (position) {
+            col = position[1] - 1;
+            row = position[2] - 1;
+        } else if (/^tile-\\d+$/.test(name)) {
+            value = parseInt(name.slice(5), 10);
+        }
+    });
+    // a merged tile is drawn over the 2 tiles it came from
+    grid[row][col] = Math.max(grid[row][col], value);
+}
+var score = document.querySelector('.score-container');
+var message = document.querySelector('.game-message');
+return {grid: grid,
+        score: parseInt(score.textContent, 10) || 0,
+        message: message ? message.className : ''};
+'''
+# Defines readState (READ_STATE_JS) and afterDraw(callback), which
+# calls back two animation frames from now. The page draws tiles, score
+# and game message in the next frame, but tiles that slid (or merged)
+# are drawn at their previous cell first and get their new position
+# class in a frame nested in that one.
+AFTER_DRAW_JS = '''
+var readState = function () {''' + READ_STATE_JS + '''};
+var afterDraw = function (callback) {
+    window.requestAnimationFrame(function () {
+        window.requestAnimationFrame(callback);
+    });
+};
+'''
+# Returns the state (as READ_STATE_JS) once the page has drawn it, run
+# with execute_async_script after a restart or a key event.
+READ_DRAWN_STATE_JS = AFTER_DRAW_JS + '''
+var done = arguments[arguments.length - 1];
+afterDraw(function () { done(readState()); });
+'''
+# Direction codes of the page's game manager.
+GAME_DIRECTIONS = {'up': 0, 'right': 1, 'down': 2, 'left': 3}
+# Makes a move and returns the new state, once drawn, with a 'moved'
+# flag, in one round trip. Calls the page's game manager if it is
+# exposed as window.gameManager, else dispatches the arrow key event.
+FAST_MOVE_JS = AFTER_DRAW_JS + '''
+var direction = arguments[0], done = arguments[arguments.length - 1];
+var before = JSON.stringify(readState().grid);
+if (window.gameManager) {
+    window.gameManager.move(direction);
+} else {
+    var keyCode = [38, 39, 40, 37][direction];
+    var event = new KeyboardEvent('keydown', {bubbles: true});
+    Object.defineProperty(event, 'keyCode', {get: function () {
+        return keyCode; }});
+    Object.defineProperty(event, 'which', {get: function () {
+        return keyCode; }});
+    document.dispatchEvent(event);
+}
+afterDraw(function () {
+    var state = readState();
+    state.moved = JSON.stringify(state.grid) !== before;
+    done(state);
+});
+'''
 
 
 class Session:
-    def __init__(self):
+    # game_trace.TraceWriter, if set every move that changed the board
+    # is recorded to it.
+    recorder = None
+    # True if the last move changed the board
+    moved = None
+    # instrumentation.Profiler to time moves and count retries with
+    profiler = NULL_PROFILER
+
+    def __init__(self, url=url2048, fast_input=False):
+        """Open the game at url in a new Chrome window.
+
+        fast_input: bool. Make moves with one script call that also
+        returns the new state (FAST_MOVE_JS), instead of key events
+        followed by a state read.
+        """
+        self.fast_input = fast_input
         self.driver = webdriver.Chrome()
-        self.driver.get(url2048)
-        self.current_grid = self.get_tiles_grid()
+        self.driver.get(url)
+        self.state = None
+        self.current_grid = None
+        self.update_grid()
 
     def end_session(self):
         """closes browser."""
         self.driver.close()
 
     def restart_game(self):
+        self.profiler.new_game()
         restart_btn = self.driver.find_element('class name', 'restart-button')
         restart_btn.click()
         self.update_grid()
+        if self.recorder is not None:
+            self.recorder.new_game()
+        self.profiler.start(THINK)
+
+    def _move(self, direction):
+        """Send arrow key of direction to the page."""
+        self.profiler.stop(THINK)
+        previous_grid = self.current_grid
+        if self.fast_input:
+            with self.profiler.phase(MOVE_SCRIPT):
+                self.state = self.driver.execute_async_script(
+                    FAST_MOVE_JS, GAME_DIRECTIONS[direction])
+            self.current_grid = np.array(self.state['grid'])
+            self.moved = self.state['moved']
+        else:
+            with self.profiler.phase(KEY_SEND):
+                action = ActionChains(self.driver)
+                action.key_down(ARROW_KEYS[direction])
+                action.perform()
+            self.update_grid()
+            self.moved = self.did_move(previous_grid)
+        if self.recorder is not None:
+            self.record_move(previous_grid, direction)
+        self.profiler.count('moves sent')
+        self.profiler.start(THINK)
+
+    def record_move(self, previous_grid, direction):
+        """Record move to recorder, if it changed the board.
+
+        The spawned tile is found by comparing current grid with
+        the grid expected by get_board_if_move_with_score.
+        """
+        expected, score = get_board_if_move_with_score(previous_grid,
+                                                       direction)
+        if np.array_equal(expected, previous_grid):
+            return
+        changed = np.flatnonzero(self.current_grid != expected)
+        if len(changed) == 1 and expected.flat[changed[0]] == 0:
+            spawn_cell = int(changed[0])
+            spawn_value = int(self.current_grid.flat[spawn_cell])
+        else:
+            spawn_cell, spawn_value = -1, 0
+        self.recorder.record(previous_grid, direction, int(score),
+                             spawn_cell, spawn_value)
 
     def right(self):
         """Move right."""
-        action = ActionChains(self.driver)
-        action.key_down(Keys.ARROW_RIGHT)
-        action.perform()
-        self.update_grid()
+        self._move('right')
 
     def left(self):
         """Move left."""
-        action = ActionChains(self.driver)
-        action.key_down(Keys.ARROW_LEFT)
-        action.perform()
-        self.update_grid()
+        self._move('left')
 
     def up(self):
         """Move up."""
-        action = ActionChains(self.driver)
-        action.key_down(Keys.ARROW_UP)
-        action.perform()
-        self.update_grid()
+        self._move('up')
 
     def down(self):
         """Move down."""
-        action = ActionChains(self.driver)
-        action.key_down(Keys.ARROW_DOWN)
-        action.perform()
-        self.update_grid()
+        self._move('down')
 
     def get_board(self):
-        """Returns a list of web elements of 'tiles-state' on board"""
-        container = self.driver.find_element('class name', 'tile-container')
-        return container.find_elements('xpath', '*')
+        """Returns a copy of the grid, to check later with did_move."""
+        return self.current_grid.copy()
 
     def get_tiles_grid(self):
         """Returns np.array with values of tiles."""
-        tiles_grid = np.array([[0 for _ in range(4)] for _ in range(4)])
-        board = self.get_board()
-        for tile in board:
-            tile_desc = tile.get_attribute('class').split(' tile-')
-            position = (int(tile_desc[2].split('-')[1]) - 1,
-                        int(tile_desc[2].split('-')[2]) - 1)
-            tile_value = int(tile_desc[1])
-            tiles_grid[position] = tile_value
-        return np.transpose(tiles_grid)
+        return self.current_grid.copy()
 
     def update_grid(self):
-        self.current_grid = self.get_tiles_grid()
+        """Read grid, score and game message of the page, once it has
+        drawn them (READ_DRAWN_STATE_JS).
+
+        One script call per update, after every move and restart. The
+        other getters use this cached state.
+        """
+        with self.profiler.phase(DOM_READ):
+            self.state = self.driver.execute_async_script(
+                READ_DRAWN_STATE_JS)
+        self.current_grid = np.array(self.state['grid'])
 
     def did_move(self, previous_board_state):
         """Returns bool if a move had been done.
 
-        previous_board_state: list of web elements.
+        previous_board_state: np.array, as returned by get_board.
         """
-        return previous_board_state != self.get_board()
+        return not np.array_equal(previous_board_state, self.current_grid)
 
     def did_move_2(self, grid):
         """Returns True if given grid different than current grid."""
@@ -92,15 +224,11 @@ class Session:
 
     def get_score(self):
         """Returns the score of the current game."""
-        score = self.driver.find_element('class name', 'score-container')
-        return int(score.text.split()[0])
-        pass
+        return self.state['score']
 
     def get_highest_tile(self):
         """Returns value of highest tile on board."""
-        board = self.get_board()
-        tiles = [int(tile.text) for tile in board if tile]
-        return max(tiles)
+        return int(np.amax(self.current_grid))
 
     def get_highest_tile_position(self, tile_value):  # TODO: this
         """Returns position of first tile that has value of tile_value.
@@ -131,29 +259,25 @@ class Session:
 
     def is_game_over(self):
         """Returns True if game is over"""
-        message = self.driver.find_element('xpath',
-                                           '/html/body/div[3]/div[4]/div[1]')
-        if message.get_attribute('class') == 'game-message game-over':
-            return True
+        return 'game-over' in self.state['message'].split()
 
     def is_win(self):
         """Returns True if reached 2048"""
-        message = self.driver.find_element('xpath',
-                                           '/html/body/div[3]/div[4]/div[1]')
-        if message.get_attribute('class') == 'game-message game-won':
-            return True
+        return 'game-won' in self.state['message'].split()
 
     # Play games based on different strategies
-    def total_random_game(self):
+    def total_random_game(self, rng=None):
         """Play a game.
 
         Moves strategy: every move is randomly picked.
+        rng: np.random.Generator or seed, picks random moves.
         Returns: (Score, Highest tile, Number of moves)
         """
+        rng = np.random.default_rng(rng)
         moves = [self.right, self.left, self.up, self.down]
         moves_count = 0
         while not (self.is_game_over() or self.is_win()):
-            np.random.shuffle(moves)
+            rng.shuffle(moves)
             current_board = self.get_board()
             for i in range(4):
                 moves[i]()
@@ -164,10 +288,11 @@ class Session:
                 self.get_highest_tile(),
                 moves_count)
 
-    def fixed_path_game(self):
+    def fixed_path_game(self, rng=None):
         """Play a game.
 
         Moves strategy: Repeatedly move based on a fixed path.
+        rng: unused, kept for the common strategy interface.
         Returns: (Score, Highest tile, Number of moves)
         """
         path = (self.right, self.up, self.left, self.down)
@@ -182,17 +307,19 @@ class Session:
                 self.get_highest_tile(),
                 moves_count)
 
-    def no_left_random_game(self):
+    def no_left_random_game(self, rng=None):
         """Play a game.
 
         Moves strategy: every move is randomly picked from
         {right, up, down}. Move left only if can't move any other way.
+        rng: np.random.Generator or seed, picks random moves.
         Returns: (Score, Highest tile, Number of moves)
         """
+        rng = np.random.default_rng(rng)
         moves = [self.right, self.up, self.down]
         moves_count = 0
         while not (self.is_game_over() or self.is_win()):
-            np.random.shuffle(moves)
+            rng.shuffle(moves)
             current_board = self.get_board()
             for i in range(4):
                 try:
@@ -208,14 +335,16 @@ class Session:
                 self.get_highest_tile(),
                 moves_count)
 
-    def right_trend_no_left_game(self):
+    def right_trend_no_left_game(self, rng=None):
         """Play a game.
 
         Moves strategy: If possible, move right, else, randomly pick
         between up or down.
         Move left only if can't move any other way.
+        rng: np.random.Generator or seed, picks random moves.
         Returns: (Score, Highest tile, Number of moves)
         """
+        rng = np.random.default_rng(rng)
         moves = [self.up, self.down]
         moves_count = 0
         while not (self.is_game_over() or self.is_win()):
@@ -224,7 +353,7 @@ class Session:
             if self.did_move(current_board):
                 moves_count += 1
             else:
-                np.random.shuffle(moves)
+                rng.shuffle(moves)
                 for i in range(3):
                     try:
                         moves[i]()
@@ -239,11 +368,12 @@ class Session:
                 self.get_highest_tile(),
                 moves_count)
 
-    def right_and_down_trend_game(self):
+    def right_and_down_trend_game(self, rng=None):
         """Play a game.
 
         Moves strategy: Try to move based on the following
         priority: right, down, up, left.
+        rng: unused, kept for the common strategy interface.
         Returns: (Score, Highest tile, Number of moves)
         """
         moves = [self.right, self.down, self.up, self.left]
@@ -259,12 +389,13 @@ class Session:
                 self.get_highest_tile(),
                 moves_count)
 
-    def r_a_d_t_with_block_flag_game(self):
+    def r_a_d_t_with_block_flag_game(self, rng=None):
         """Play a game.
 
         Moves strategy: Try to move based on the following
         priority: right, down, up, left, but if 'block' flag
         is on, switch between down and up.
+        rng: unused, kept for the common strategy interface.
         Returns: (Score, Highest tile, Number of moves)
         """
         moves_flag_off = [self.right, self.down, self.up, self.left]
@@ -286,6 +417,81 @@ class Session:
         pass
 
 
+class LocalSession(Session):
+    """Headless 2048 game, a drop-in replacement for Session.
+
+    Moves are computed in-process with get_board_if_move_with_score.
+    After every move that changed the board a tile spawns on a random
+    empty cell: 2 with probability 0.9, else 4 (same as the web game).
+
+    seed: int or np.random.Generator. Seed of the tile spawning RNG.
+    win_tile: int. Tile value that ends the game as a win.
+    """
+
+    def __init__(self, seed=None, win_tile=2048):
+        self.rng = np.random.default_rng(seed)
+        self.win_tile = win_tile
+        self.score = 0
+        self.current_grid = None
+        self.restart_game()
+
+    def end_session(self):
+        """Nothing to close, kept for compatibility with Session."""
+        pass
+
+    def restart_game(self):
+        self.profiler.new_game()
+        self.current_grid = np.zeros((4, 4), dtype=int)
+        self.score = 0
+        self.add_random_tile()
+        self.add_random_tile()
+        if self.recorder is not None:
+            self.recorder.new_game()
+        self.profiler.start(THINK)
+
+    def add_random_tile(self):
+        """Put a 2 or 4 tile on a random empty cell."""
+        empty = np.argwhere(self.current_grid == 0)
+        if len(empty):
+            position = tuple(empty[self.rng.integers(len(empty))])
+            self.current_grid[position] = 2 if self.rng.random() < 0.9 else 4
+
+    def _move(self, direction):
+        self.profiler.stop(THINK)
+        previous_grid = self.current_grid
+        with self.profiler.phase(ENGINE_MOVE):
+            grid, score = get_board_if_move_with_score(previous_grid,
+                                                       direction)
+            self.moved = not np.array_equal(grid, previous_grid)
+            if self.moved:
+                self.current_grid = grid
+                self.score += int(score)
+                self.add_random_tile()
+        if self.moved and self.recorder is not None:
+            self.record_move(previous_grid, direction)
+        self.profiler.count('moves sent')
+        self.profiler.start(THINK)
+
+    def update_grid(self):
+        pass
+
+    def get_score(self):
+        """Returns the score of the current game."""
+        return self.score
+
+    def is_game_over(self):
+        """Returns True if no move can change the board."""
+        grid = self.current_grid
+        if not grid.all():
+            return False
+        return not (np.any(grid[:, :-1] == grid[:, 1:]) or
+                    np.any(grid[:-1, :] == grid[1:, :]))
+
+    def is_win(self):
+        """Returns True if reached win_tile"""
+        return np.amax(self.current_grid) >= self.win_tile
+
+
 def move_row(row):
     """rearrange row, based on game rules."""
     temp = [x for x in row if x != 0]
@@ -301,7 +507,12 @@ def move_row(row):
 
 
 def get_board_if_move(cur_grid, direction):
-    """Return board grid if moved in direction (without added tile)."""
+    """Return board grid if moved in direction (without added tile).
+
+    cur_grid: np.array, or bitboard (int) - then a bitboard is returned.
+    """
+    if isinstance(cur_grid, int):
+        return bitboard.move(cur_grid, direction)[0]
     grid = np.copy(cur_grid)
 
     if direction == 'down':
@@ -417,8 +628,12 @@ def get_distance_from_lower_right_corner(coor):
 def get_board_if_move_with_score(cur_grid, direction):
     """Return board grid if moved in direction (without added tile).
 
+    :param cur_grid: np.array, or bitboard (int) - then the returned
+    grid is a bitboard too, computed with table lookups.
     :returns: tuple. grid (np.array) and score that earned by move.
     """
+    if isinstance(cur_grid, int):
+        return bitboard.move(cur_grid, direction)
     grid = np.copy(cur_grid)
     score = 0
 
@@ -453,15 +668,17 @@ def get_board_if_move_with_score(cur_grid, direction):
     return grid, score
 
 
-def greedy_random_game(session):
+def greedy_random_game(session, rng=None):
     """Play a game.
 
     Strategy: First check if can increase highest tile.
     Else, choose a random move.
 
     :param session: Session object.
+    :param rng: np.random.Generator or seed, picks random moves.
     :return: (Score, Highest tile, Number of moves)
     """
+    rng = np.random.default_rng(rng)
     moves = {'right': session.right, 'left': session.left,
              'up': session.up, 'down': session.down}
 
@@ -473,21 +690,21 @@ def greedy_random_game(session):
             possible_grids = get_if_moved_grids(session.current_grid)
             higher_tile_possible = []
             if is_higher_or_equal_max_value(session.current_grid,
-                                            possible_grids['right']):
+                                            possible_grids['right'][0]):
                 higher_tile_possible += ['right', 'left']
             if is_higher_or_equal_max_value(session.current_grid,
-                                            possible_grids['up']):
+                                            possible_grids['up'][0]):
                 higher_tile_possible += ['up', 'down']
             # if can get higher tile, randomly choose direction which
             # increases tile
             if higher_tile_possible:
-                move = np.random.choice(higher_tile_possible)
+                move = rng.choice(higher_tile_possible)
                 moves[move]()
                 moves_count += 1
 
             else:
                 directions = list(moves.keys())
-                np.random.shuffle(directions)
+                rng.shuffle(directions)
                 current_board = session.get_board()
                 for i in range(4):
                     moves[directions[i]]()
@@ -497,6 +714,7 @@ def greedy_random_game(session):
             # time.sleep(0.05)
             attempts = 7
         except StaleElementReferenceException:
+            session.profiler.count('stale retries')
             attempts -= 1
     max_tile, _ = get_max_tile(session.current_grid)
     return (session.get_score(),
@@ -504,15 +722,17 @@ def greedy_random_game(session):
             moves_count)
 
 
-def score_greedy_random_game(session):
+def score_greedy_random_game(session, rng=None):
     """Play a game.
 
     Strategy: Check which direction yields the highest score.
     Else, choose a random move.
 
     :param session: Session object.
+    :param rng: np.random.Generator or seed, picks random moves.
     :return: (Score, Highest tile, Number of moves)
     """
+    rng = np.random.default_rng(rng)
     moves = {'right': session.right, 'left': session.left,
              'up': session.up, 'down': session.down}
 
@@ -531,13 +751,13 @@ def score_greedy_random_game(session):
                     poss_moves.append(direction)
                     max_score = grid_score[1]
             if poss_moves:
-                move = np.random.choice(poss_moves)
+                move = rng.choice(poss_moves)
                 moves[move]()
                 moves_count += 1
 
             else:
                 directions = list(moves.keys())
-                np.random.shuffle(directions)
+                rng.shuffle(directions)
                 current_board = session.get_board()
                 for i in range(4):
                     moves[directions[i]]()
@@ -547,6 +767,7 @@ def score_greedy_random_game(session):
             # time.sleep(0.2)
             attempts = 7
         except StaleElementReferenceException:
+            session.profiler.count('stale retries')
             attempts -= 1
     max_tile, _ = get_max_tile(session.current_grid)
     return (session.get_score(),
@@ -554,15 +775,17 @@ def score_greedy_random_game(session):
             moves_count)
 
 
-def greedy_rtnl_game(session):
+def greedy_rtnl_game(session, rng=None):
     """Play a game.
 
     Moves strategy: If possible get higher top tile
     (right before up or down), else move right, else,
     randomly pick between up or down.
     Move left only if can't move any other way.
+    rng: np.random.Generator or seed, picks random moves.
     Returns: (Score, Highest tile, Number of moves)
     """
+    rng = np.random.default_rng(rng)
     moves = {'up': session.up, 'down': session.down}
     moves_count = 0
     attempts = 8
@@ -572,16 +795,16 @@ def greedy_rtnl_game(session):
             possible_grids = get_if_moved_grids(session.current_grid)
             higher_tile_possible = []
             if is_higher_or_equal_max_value(session.current_grid,
-                                            possible_grids['right']):
+                                            possible_grids['right'][0]):
                 higher_tile_possible += ['right']
             if is_higher_or_equal_max_value(session.current_grid,
-                                            possible_grids['up']):
+                                            possible_grids['up'][0]):
                 higher_tile_possible += ['up', 'down']
             if higher_tile_possible:
                 if 'right' in higher_tile_possible:
                     session.right()
                 else:
-                    move = np.random.choice(higher_tile_possible)
+                    move = rng.choice(higher_tile_possible)
                     moves[move]()
                 moves_count += 1
             else:
@@ -591,7 +814,7 @@ def greedy_rtnl_game(session):
                     moves_count += 1
                 else:
                     directions = list(moves.keys())
-                    np.random.shuffle(directions)
+                    rng.shuffle(directions)
                     for i in range(3):
                         try:
                             moves[directions[i]]()
@@ -605,6 +828,7 @@ def greedy_rtnl_game(session):
             # time.sleep(0.05)
             attempts = 8
         except StaleElementReferenceException:
+            session.profiler.count('stale retries')
             attempts -= 1
     max_tile, _ = get_max_tile(session.current_grid)
     return (session.get_score(),
@@ -612,7 +836,91 @@ def greedy_rtnl_game(session):
             moves_count)
 
 
+class MovesCache:
+    """LRU cache of get_if_moved_grids results, keyed by board state.
+
+    Cached grids are read-only since they are shared between callers.
+    maxsize: int. Max number of boards kept, 0 disables caching.
+    symmetric: bool. Key by bitboard.canonical, so the 8 rotations and
+    reflections of a board share an entry, mapped back on every lookup.
+    Safe to share between threads (e.g. sessions of a SessionPool).
+    """
+
+    def __init__(self, maxsize=MOVES_CACHE_SIZE, symmetric=False):
+        self.maxsize = maxsize
+        self.symmetric = symmetric
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_if_moved_grids(self, curr_grid):
+        """Same as get_if_moved_grids, computed once per board state."""
+        is_board = isinstance(curr_grid, int)
+        if not self.symmetric:
+            return self._get(curr_grid if is_board else curr_grid.tobytes(),
+                             curr_grid)
+        key, symmetry = bitboard.canonical(
+            curr_grid if is_board else bitboard.from_grid(curr_grid))
+        if symmetry == 0:
+            return self._get((key, is_board), curr_grid)
+        if is_board:
+            if_moved = self._get((key, is_board), key)
+            invert = bitboard.invert_symmetry
+        else:
+            if_moved = self._get((key, is_board), bitboard.apply_symmetry_grid(
+                curr_grid, symmetry))
+            invert = bitboard.invert_symmetry_grid
+        moved = dict()
+        for direction in if_moved:
+            grid, score = if_moved[bitboard.direction_to_canonical(direction,
+                                                                   symmetry)]
+            moved[direction] = invert(grid, symmetry), score
+        return moved
+
+    def _get(self, key, curr_grid):
+        """Returns cached get_if_moved_grids(curr_grid) of key."""
+        with self.lock:
+            if_moved = self.entries.get(key)
+            if if_moved is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return if_moved
+            self.misses += 1
+        if_moved = get_if_moved_grids(curr_grid)
+        if self.maxsize > 0:
+            for grid, _ in if_moved.values():
+                if isinstance(grid, np.ndarray):
+                    grid.flags.writeable = False
+            with self.lock:
+                self.entries[key] = if_moved
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return if_moved
+
+    def info(self):
+        """Returns dict of hits, misses, maxsize and current size."""
+        return {'hits': self.hits, 'misses': self.misses,
+                'maxsize': self.maxsize, 'currsize': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
 class Board:
+    """Node of moves tree.
+
+    grid: np.array, or bitboard (int, see bitboard.from_grid) for
+    cheaper expansion of children.
+    Children are computed through Board.cache, a MovesCache shared by
+    all boards; replace it to change its size.
+    """
+
+    cache = MovesCache()
+
     def __init__(self, grid, score=0, direction=''):
         self.grid = grid
         self.direction = direction
@@ -620,7 +928,8 @@ class Board:
         self.children = []
 
     def add_children(self):
-        for direction, grid_score in get_if_moved_grids(self.grid).items():
+        for direction, grid_score in self.cache.get_if_moved_grids(
+                self.grid).items():
             child = Board(grid=grid_score[0],
                           score=grid_score[1],
                           direction=direction)
@@ -630,6 +939,56 @@ class Board:
         for child in self.children:
             child.add_children()
 
+    def size(self):
+        """Returns number of nodes in the tree of this board."""
+        return 1 + sum(child.size() for child in self.children)
+
+
+class BoardNode:
+    """Memory lean node of moves tree.
+
+    Holds the board as a bitboard and the move that led to it as an
+    index of bitboard.DIRECTIONS. Children are expanded on first
+    access of children, and moves that don't change the board are
+    left out. Can be used in place of Board in
+    get_potentially_highest_moves and get_potential_moves_score.
+    """
+
+    __slots__ = ('board', 'score', 'move', '_children')
+
+    def __init__(self, board, score=0, move=-1):
+        self.board = board
+        self.score = score
+        self.move = move
+        self._children = None
+
+    @classmethod
+    def from_grid(cls, grid):
+        """Returns root node of np.array grid."""
+        return cls(bitboard.from_grid(grid))
+
+    @property
+    def grid(self):
+        """np.array of the board."""
+        return bitboard.to_grid(self.board)
+
+    @property
+    def direction(self):
+        """Name of the move that led to this node ('' for root)."""
+        return bitboard.DIRECTIONS[self.move] if self.move >= 0 else ''
+
+    @property
+    def children(self):
+        """Tuple of nodes of moves that change the board."""
+        if self._children is None:
+            children = []
+            for move, direction in enumerate(bitboard.DIRECTIONS):
+                board, score = bitboard.move(self.board, direction)
+                if board != self.board:
+                    children.append(BoardNode(board, score, move))
+            self._children = tuple(children)
+        return self._children
+
 
 def get_potentially_highest_moves(board):
     """Calculates potential score of up to 2 steps ahead.
@@ -669,15 +1028,17 @@ def get_potential_moves_score(board):
     return potential_score
 
 
-def two_step_score_greedy_random_game(session):
+def two_step_score_greedy_random_game(session, rng=None):
     """Play a game.
 
     Strategy: Check which direction yields the highest score.
     Else, choose a random move.
 
     :param session: Session object.
+    :param rng: np.random.Generator or seed, picks random moves.
     :return: (Score, Highest tile, Number of moves)
     """
+    rng = np.random.default_rng(rng)
     moves = {'right': session.right, 'left': session.left,
              'up': session.up, 'down': session.down}
 
@@ -688,12 +1049,15 @@ def two_step_score_greedy_random_game(session):
             cur_board = Board(grid=session.current_grid)
             cur_board.add_children()
             cur_board.add_grandchildren()
+            if session.profiler.enabled:
+                session.profiler.count('tree nodes', cur_board.size())
             p_highest_moves = get_potentially_highest_moves(cur_board)
-            moves[np.random.choice(p_highest_moves)]()
+            moves[rng.choice(p_highest_moves)]()
             moves_count += 1
             # time.sleep(0.2)
             attempts = 7
         except StaleElementReferenceException:
+            session.profiler.count('stale retries')
             attempts -= 1
     max_tile, _ = get_max_tile(session.current_grid)
     return (session.get_score(),
@@ -701,7 +1065,7 @@ def two_step_score_greedy_random_game(session):
             moves_count)
 
 
-def two_step_score_greedy_no_left_game(session):
+def two_step_score_greedy_no_left_game(session, rng=None):
     """Play a game.
 
     Strategy: Check which direction yields the highest score
@@ -709,8 +1073,10 @@ def two_step_score_greedy_no_left_game(session):
     Move left only as a last resort.
 
     :param session: Session object.
+    :param rng: np.random.Generator or seed, picks random moves.
     :return: (Score, Highest tile, Number of moves)
     """
+    rng = np.random.default_rng(rng)
     moves = {'right': session.right, 'left': session.left,
              'up': session.up, 'down': session.down}
 
@@ -721,9 +1087,11 @@ def two_step_score_greedy_no_left_game(session):
             cur_board = Board(grid=session.current_grid)
             cur_board.add_children()
             cur_board.add_grandchildren()
+            if session.profiler.enabled:
+                session.profiler.count('tree nodes', cur_board.size())
             p_moves_score = get_potential_moves_score(cur_board)
             # shuffle list
-            np.random.shuffle(p_moves_score)
+            rng.shuffle(p_moves_score)
             # sort descending
             p_moves_score = sorted(p_moves_score, key=lambda x: x[1],
                                    reverse=True)
@@ -740,6 +1108,7 @@ def two_step_score_greedy_no_left_game(session):
             # time.sleep(0.1)
             attempts = 9
         except StaleElementReferenceException:
+            session.profiler.count('stale retries')
             attempts -= 1
     max_tile, _ = get_max_tile(session.current_grid)
     return (session.get_score(),
@@ -747,6 +1116,23 @@ def two_step_score_greedy_no_left_game(session):
             moves_count)
 
 
+# Strategies by the name written to data files.
+# Each is called with a session and an optional np.random.Generator
+# (or seed) for its random moves: strategy(session, rng=rng).
+STRATEGIES = {'tr': Session.total_random_game,
+              'fp': Session.fixed_path_game,
+              'nlr': Session.no_left_random_game,
+              'rtnl': Session.right_trend_no_left_game,
+              'radt': Session.right_and_down_trend_game,
+              'radtbf': Session.r_a_d_t_with_block_flag_game,
+              'greedy_random': greedy_random_game,
+              'sgr': score_greedy_random_game,
+              'grtnl': greedy_rtnl_game,
+              '2ssgr': two_step_score_greedy_random_game,
+              '2ssgnl': two_step_score_greedy_no_left_game,
+              'expectimax': expectimax_game}
+
+
 def main():
     ns = Session()
     for _ in range(1):
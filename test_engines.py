@@ -0,0 +1,87 @@
+# test_engines.py - the bitboard and batch engines, and replays of
+# recorded games, must match the grid engine of simulateGame.
+# Run with: python -m pytest -q
+
+import numpy as np
+import pytest
+
+import batch_game
+import bitboard
+import game_trace
+import simulateGame
+
+N_BOARDS = 500
+
+
+def random_grids(n=N_BOARDS, seed=0):
+    """Returns (n, 4, 4) array of boards with tiles from 2 to 2 ** 14."""
+    rng = np.random.default_rng(seed)
+    exponents = rng.integers(1, 15, size=(n, 4, 4))
+    # small exponents more often, so there are plenty of merges
+    exponents = np.where(rng.random((n, 4, 4)) < 0.5,
+                         rng.integers(1, 4, size=(n, 4, 4)), exponents)
+    return np.where(rng.random((n, 4, 4)) < 0.6, 1 << exponents, 0)
+
+
+@pytest.mark.parametrize('direction', bitboard.DIRECTIONS)
+def test_bitboard_move_matches_grid_move(direction):
+    for grid in random_grids():
+        expected, expected_score = simulateGame.get_board_if_move_with_score(
+            grid, direction)
+        board, score = bitboard.move(bitboard.from_grid(grid), direction)
+        assert np.array_equal(bitboard.to_grid(board), expected)
+        assert score == expected_score
+
+
+def test_bitboard_grid_round_trip():
+    for grid in random_grids():
+        assert np.array_equal(bitboard.to_grid(bitboard.from_grid(grid)),
+                              grid)
+
+
+@pytest.mark.parametrize('direction', range(4))
+def test_move_boards_matches_grid_move(direction):
+    grids = random_grids()
+    moved, scores = batch_game.move_boards(batch_game.grids_to_boards(grids),
+                                           direction)
+    moved_grids = batch_game.boards_to_grids(moved)
+    for grid, moved_grid, score in zip(grids, moved_grids, scores):
+        expected, expected_score = simulateGame.get_board_if_move_with_score(
+            grid, bitboard.DIRECTIONS[direction])
+        assert np.array_equal(moved_grid, expected)
+        assert score == expected_score
+
+
+def record_games(path, n_games, seed):
+    """Play n_games of 2ssgnl on a LocalSession recorded to path."""
+    session = simulateGame.LocalSession(seed=seed)
+    results = []
+    with game_trace.TraceWriter(path) as writer:
+        session.recorder = writer
+        for game in range(n_games):
+            session.restart_game()
+            results.append(simulateGame.two_step_score_greedy_no_left_game(
+                session, rng=game))
+    return results
+
+
+def test_replay_game_round_trip(tmp_path):
+    path = str(tmp_path / 'games.trace')
+    results = record_games(path, 2, seed=1)
+    trace = game_trace.load_trace(path)
+    for game, (score, highest_tile, moves_count) in enumerate(results):
+        records = game_trace.game_records(trace, game)
+        assert game_trace.replay_game(records) == (score, highest_tile,
+                                                   len(records))
+
+
+def test_trace_writer_drops_partial_record(tmp_path):
+    path = str(tmp_path / 'games.trace')
+    record_games(path, 1, seed=2)
+    with open(path, 'ab') as file:
+        file.write(b'\x00' * (game_trace.TRACE_DTYPE.itemsize // 2))
+    results = record_games(path, 1, seed=3)
+    trace = game_trace.load_trace(path)
+    assert trace.nbytes == (tmp_path / 'games.trace').stat().st_size
+    records = game_trace.game_records(trace, 1)
+    assert game_trace.replay_game(records)[:2] == results[0][:2]
@@ -0,0 +1,38 @@
+# test_evolving_algorithm.py - the vectorized features of moves must
+# match evaluate_move, and the genetic algorithm must give the same
+# genomes whether a run is resumed from a checkpoint or not.
+# Run with: python -m pytest -q
+
+import numpy as np
+import pandas as pd
+
+import evolving_algorithm
+from simulateGame import Board, get_if_moved_grids
+from test_engines import random_grids
+
+N_GENERATIONS = 4
+STOP_GENERATION = 2
+
+
+def test_extract_features_matches_evaluate_move():
+    grids, scores = zip(*[grid_score for grid in random_grids()
+                          for grid_score in get_if_moved_grids(grid).values()])
+    features = evolving_algorithm.extract_features(grids, scores)
+    for grid, score, row in zip(grids, scores, features):
+        params = evolving_algorithm.evaluate_move(Board(grid, score))
+        assert np.allclose(row, [params[weight]
+                                 for weight in evolving_algorithm.WEIGHTS])
+
+
+def test_resume_matches_uninterrupted_run(tmp_path, monkeypatch):
+    path = str(tmp_path / 'checkpoint.npz')
+    population = evolving_algorithm.initialize_population(rng=0)
+    monkeypatch.setattr(evolving_algorithm, 'MAX_GENERATION', STOP_GENERATION)
+    evolving_algorithm.main_process(1, population, n_games=1, workers=1,
+                                    seed=1, checkpoint_path=path)
+    monkeypatch.setattr(evolving_algorithm, 'MAX_GENERATION', N_GENERATIONS)
+    resumed = evolving_algorithm.resume(path, n_games=1, workers=1)
+    uninterrupted = evolving_algorithm.main_process(1, population, n_games=1,
+                                                    workers=1, seed=1)
+    assert resumed['generation'].max() == N_GENERATIONS + 1
+    pd.testing.assert_frame_equal(resumed, uninterrupted)
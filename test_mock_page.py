@@ -0,0 +1,345 @@
+# test_mock_page.py - Session against mock_2048.html, without a browser.
+# The page runs in node on a minimal fake DOM, and animation frames run
+# only while an async script waits for its callback, so a script that
+# reads the page right away sees it before it is drawn, as a client
+# faster than a frame would.
+# Run with: python -m pytest -q (skipped if node is not installed)
+
+import json
+import shutil
+import subprocess
+from urllib.parse import urlsplit
+
+import numpy as np
+import pytest
+from selenium.webdriver.common.keys import Keys
+
+import simulateGame
+from mock_server import PAGE_PATH
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None,
+                                reason='node is not installed')
+
+# Reads commands from stdin, a JSON object per line, and writes a JSON
+# object per line: {value: result} or {error: message}.
+FAKE_PAGE_JS = r'''
+var readline = require('readline');
+
+function Element(tagName, className) {
+  this.tagName = tagName;
+  this.className = className || '';
+  this.children = [];
+  this.text = '';
+  this.style = {};
+  this.listeners = {};
+}
+Element.prototype.appendChild = function (child) {
+  this.children.push(child);
+  return child;
+};
+Object.defineProperty(Element.prototype, 'textContent', {
+  get: function () {
+    return this.text + this.children.map(function (child) {
+      return child.textContent; }).join('');
+  },
+  set: function (text) { this.text = String(text); this.children = []; }
+});
+Object.defineProperty(Element.prototype, 'innerHTML', {
+  set: function () { this.text = ''; this.children = []; }
+});
+// selectors: '.class', 'tag' or 'A > B' of those
+Element.prototype.matches = function (selector) {
+  if (selector[0] === '.') {
+    return this.className.split(' ').indexOf(selector.slice(1)) >= 0;
+  }
+  return this.tagName === selector;
+};
+Element.prototype.descendants = function () {
+  var all = [];
+  this.children.forEach(function (child) {
+    all.push(child);
+    all.push.apply(all, child.descendants());
+  });
+  return all;
+};
+Element.prototype.querySelectorAll = function (selector) {
+  var parts = selector.split(' > ');
+  var found = this.descendants().filter(function (element) {
+    return element.matches(parts[0]); });
+  if (parts.length === 2) {
+    found = [].concat.apply([], found.map(function (element) {
+      return element.children.filter(function (child) {
+        return child.matches(parts[1]); });
+    }));
+  }
+  return found;
+};
+Element.prototype.querySelector = function (selector) {
+  return this.querySelectorAll(selector)[0] || null;
+};
+Element.prototype.addEventListener = function (type, listener) {
+  (this.listeners[type] = this.listeners[type] || []).push(listener);
+};
+Element.prototype.dispatchEvent = function (event) {
+  (this.listeners[event.type] || []).forEach(function (listener) {
+    listener(event); });
+};
+
+function KeyboardEvent(type) { this.type = type; }
+KeyboardEvent.prototype.preventDefault = function () {};
+
+// builds the elements of the page's body, which has only nested tags
+// with class attributes and text
+function parseBody(html) {
+  var body = new Element('body'), open = [body], match;
+  var token = /<(\/?)(\w+)(?:\s+class="([^"]*)")?[^>]*>|([^<]+)/g;
+  while ((match = token.exec(html)) !== null) {
+    var parent = open[open.length - 1];
+    if (match[4] !== undefined) {
+      parent.text += match[4].trim();
+    } else if (match[1]) {
+      open.pop();
+    } else {
+      open.push(parent.appendChild(new Element(match[2], match[3])));
+    }
+  }
+  return body;
+}
+
+var frames = [];
+function runFrame() {
+  var due = frames;
+  frames = [];
+  due.forEach(function (callback) { callback(0); });
+}
+
+function load(page, search) {
+  var body = page.slice(page.indexOf('<body>') + 6, page.indexOf('<script>'));
+  var script = page.slice(page.indexOf('<script>') + 8,
+                          page.indexOf('</script>'));
+  frames = [];
+  document = new Element('#document');
+  document.head = document.appendChild(new Element('head'));
+  document.body = document.appendChild(parseBody(body));
+  document.createElement = function (tagName) {
+    return new Element(tagName); };
+  window.location = {search: search};
+  new Function(script)();
+}
+
+globalThis.window = globalThis;
+window.KeyboardEvent = KeyboardEvent;
+window.requestAnimationFrame = function (callback) { frames.push(callback); };
+
+var commands = {
+  load: function (command) { load(command.page, command.search); },
+  execute: function (command) {
+    return new Function(command.script).apply(window, command.args);
+  },
+  // runs frames until the script calls back
+  execute_async: function (command) {
+    var result, done = false;
+    new Function(command.script).apply(window, command.args.concat(
+      [function (value) { result = value; done = true; }]));
+    for (var i = 0; i < 10 && !done; i++) runFrame();
+    if (!done) throw new Error('script timeout');
+    return result;
+  },
+  click: function (command) {
+    document.querySelector('.' + command.className).dispatchEvent(
+      {type: 'click', preventDefault: function () {}});
+  },
+  key: function (command) {
+    var event = new KeyboardEvent('keydown');
+    event.which = event.keyCode = command.which;
+    document.dispatchEvent(event);
+  },
+  frames: function (command) {
+    for (var i = 0; i < command.n; i++) runFrame();
+  }
+};
+
+readline.createInterface({input: process.stdin}).on('line', function (line) {
+  var command = JSON.parse(line), reply;
+  try {
+    var value = commands[command.op](command);
+    reply = {value: value === undefined ? null : value};
+  } catch (error) {
+    reply = {error: String(error.stack || error)};
+  }
+  process.stdout.write(JSON.stringify(reply) + '\n');
+});
+'''
+# Returns the state of the page's game manager, drawn or not.
+GAME_STATE_JS = '''
+var manager = window.gameManager;
+return {grid: manager.grid.map(function (cells) {
+            return cells.map(function (tile) {
+                return tile ? tile.value : 0; }); }),
+        score: manager.score,
+        over: manager.over};
+'''
+KEY_CODES = {Keys.ARROW_UP: 38, Keys.ARROW_RIGHT: 39,
+             Keys.ARROW_DOWN: 40, Keys.ARROW_LEFT: 37}
+# a random game is over in about 150 moves
+N_MOVES = 1000
+
+
+class FakeDriver:
+    """The part of the WebDriver API Session uses, on the fake page."""
+
+    def __init__(self):
+        with open(PAGE_PATH) as file:
+            self.page = file.read()
+        self.process = subprocess.Popen(['node', '-e', FAKE_PAGE_JS],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, text=True)
+
+    def send(self, op, **command):
+        self.process.stdin.write(json.dumps(dict(command, op=op)) + '\n')
+        self.process.stdin.flush()
+        reply = json.loads(self.process.stdout.readline())
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['value']
+
+    def get(self, url):
+        query = urlsplit(url).query
+        self.send('load', page=self.page, search='?' + query if query else '')
+
+    def execute_script(self, script, *args):
+        return self.send('execute', script=script, args=list(args))
+
+    def execute_async_script(self, script, *args):
+        return self.send('execute_async', script=script, args=list(args))
+
+    def run_frames(self, n=1):
+        self.send('frames', n=n)
+
+    def find_element(self, by, value):
+        return FakeElement(self, value)
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+class FakeElement:
+    def __init__(self, driver, class_name):
+        self.driver = driver
+        self.class_name = class_name
+
+    def click(self):
+        self.driver.send('click', className=self.class_name)
+
+
+class FakeActionChains:
+    def __init__(self, driver):
+        self.driver = driver
+        self.keys = []
+
+    def key_down(self, key):
+        self.keys.append(key)
+        return self
+
+    def perform(self):
+        for key in self.keys:
+            self.driver.send('key', which=KEY_CODES[key])
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    driver = FakeDriver()
+    monkeypatch.setattr(simulateGame.webdriver, 'Chrome', lambda: driver)
+    monkeypatch.setattr(simulateGame, 'ActionChains', FakeActionChains)
+    yield driver
+    driver.close()
+
+
+def open_session(seed=1, fast_input=False, sync=False):
+    return simulateGame.Session(
+        url=f'http://127.0.0.1/?seed={seed}' + ('&sync=1' if sync else ''),
+        fast_input=fast_input)
+
+
+def check_moves(driver, session, n_moves=N_MOVES, seed=0):
+    """Make random moves till the game is over, at most n_moves. The
+    state the session reads after every one must be the game manager's.
+    """
+    rng = np.random.default_rng(seed)
+    moves = [session.right, session.left, session.up, session.down]
+    for _ in range(n_moves):
+        before = driver.execute_script(GAME_STATE_JS)
+        if before['over']:
+            break
+        moves[rng.integers(4)]()
+        after = driver.execute_script(GAME_STATE_JS)
+        assert np.array_equal(session.current_grid, after['grid'])
+        assert session.get_score() == after['score']
+        assert session.moved == (after['grid'] != before['grid'])
+        assert session.is_game_over() == after['over']
+
+
+def test_key_moves_read_drawn_state(driver):
+    session = open_session()
+    assert np.count_nonzero(session.current_grid) == 2
+    check_moves(driver, session)
+    assert session.is_game_over()
+
+
+def test_restart_reads_new_game(driver):
+    session = open_session()
+    check_moves(driver, session)
+    session.restart_game()
+    state = driver.execute_script(GAME_STATE_JS)
+    assert np.array_equal(session.current_grid, state['grid'])
+    assert np.count_nonzero(session.current_grid) == 2
+    assert session.get_score() == 0
+    assert not session.is_game_over()
+    check_moves(driver, session, n_moves=10, seed=1)
+
+
+def test_fast_moves_read_drawn_state(driver):
+    session = open_session(fast_input=True)
+    check_moves(driver, session)
+    assert session.is_game_over()
+
+
+def test_slid_tiles_are_drawn_a_frame_late(driver):
+    """Like the real page, a move is drawn in the next frame, with the
+    tiles that slid at their previous cell till the frame after."""
+    open_session()
+    rng = np.random.default_rng(0)
+    late = 0
+    for _ in range(100):
+        driver.execute_script('window.gameManager.move(arguments[0]);',
+                              int(rng.integers(4)))
+        grid = driver.execute_script(GAME_STATE_JS)['grid']
+        driver.run_frames(1)
+        drawn = driver.execute_script(simulateGame.READ_STATE_JS)['grid']
+        late += drawn != grid
+        driver.run_frames(1)
+        drawn = driver.execute_script(simulateGame.READ_STATE_JS)['grid']
+        assert drawn == grid
+    assert late > 50
+
+
+def test_sync_page_draws_right_away(driver):
+    open_session(sync=True)
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        driver.execute_script('window.gameManager.move(arguments[0]);',
+                              int(rng.integers(4)))
+        state = driver.execute_script(GAME_STATE_JS)
+        assert driver.execute_script(
+            simulateGame.READ_STATE_JS)['grid'] == state['grid']
+
+
+def test_restart_clears_game_message_right_away(driver):
+    session = open_session()
+    check_moves(driver, session)
+    assert 'game-over' in driver.execute_script(
+        simulateGame.READ_STATE_JS)['message']
+    driver.find_element('class name', 'restart-button').click()
+    assert driver.execute_script(
+        simulateGame.READ_STATE_JS)['message'] == 'game-message'